@@ -0,0 +1,82 @@
+"""
+Runs the AI in a child process so the pygame loop keeps drawing while it thinks.
+"""
+import multiprocessing
+import queue
+
+from app.chess_ai import GreedyAI
+from app.transposition_table import TranspositionTable
+
+# A spawned worker starts from a clean interpreter instead of a fork of the pygame process,
+# which carries SDL's state and its SIGTERM handler along
+_context = multiprocessing.get_context('spawn')
+
+
+def _run_worker(ai_class, task_queue, result_queue):
+    """
+    Worker loop: takes GameState snapshots off task_queue and posts the chosen moves to result_queue.
+    The transposition table lives as long as the worker, so it is reused from move to move.
+    """
+    transposition_table = TranspositionTable()
+    while True:
+        game_state = task_queue.get()
+        if game_state is None:
+            return
+        result_queue.put(ai_class(game_state, transposition_table=transposition_table).find_move())
+
+
+class AIWorker:
+    """
+    Background AI for the game loop.
+
+    request_move sends a snapshot of the position to the worker process, and poll
+    returns the chosen move once it is ready, without blocking. cancel drops a search
+    that is no longer wanted by stopping the process; the next request starts a new one.
+    """
+    def __init__(self, ai_class=GreedyAI):
+        self.ai_class = ai_class
+        self.process = None
+        self.task_queue = None
+        self.result_queue = None
+        self.searching = False
+
+    def start(self):
+        self.task_queue = _context.Queue()
+        self.result_queue = _context.Queue()
+        self.process = _context.Process(target=_run_worker, args=(self.ai_class, self.task_queue, self.result_queue), daemon=True)
+        self.process.start()
+
+    def request_move(self, game_state):
+        if self.process is None:
+            self.start()
+        self.task_queue.put(game_state)
+        self.searching = True
+
+    def poll(self):
+        """
+        The move found by the worker, or None while it is still searching
+        """
+        if not self.searching:
+            return None
+        try:
+            move = self.result_queue.get_nowait()
+        except queue.Empty:
+            return None
+        self.searching = False
+        return move
+
+    def cancel(self):
+        """
+        Stops a running search, its result is never returned
+        """
+        if self.searching:
+            self.close()
+
+    def close(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+        self.process = None
+        self.task_queue = None
+        self.result_queue = None
+        self.searching = False
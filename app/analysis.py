@@ -0,0 +1,152 @@
+"""
+Batch analysis of FEN/EPD files across a process pool.
+
+Positions are streamed from the input file and searched by SearchAI in worker
+processes. Each result is appended to the output file as a JSON line as soon
+as it completes, so memory stays bounded however large the input is. Results
+carry the index of their position in the input, so an interrupted run picks
+up where it stopped when started again with the same output file.
+
+    python -m app.analysis positions.epd results.jsonl --workers 8 --depth 4
+"""
+import argparse, json, os, time
+
+from app.fen import FENConverter
+from app.game_state import GameState
+from app.chess_ai import SearchAI
+from app import worker_pool
+
+DEFAULT_DEPTH = 4
+TAIL_CHUNK = 4096 # Bytes read at a time while looking back for the last newline of the output
+
+
+def analyse_position(game_state, max_depth=DEFAULT_DEPTH, time_limit=None, node_limit=None, transposition_table=None):
+    """
+    Searches game_state and returns a dict of bestmove, score (centipawns from the side
+    to move), depth, nodes and time. bestmove is None when there is no legal move.
+    """
+    ai = SearchAI(game_state, max_depth=max_depth, time_limit=time_limit, node_limit=node_limit,
+                  transposition_table=transposition_table)
+    start = time.perf_counter()
+    move = ai.find_move()
+    return {
+        'bestmove': move.get_chess_notation() if move is not None else None,
+        'score': ai.best_score,
+        'depth': ai.depth_reached,
+        'nodes': ai.nodes,
+        'time': round(time.perf_counter() - start, 4),
+    }
+
+
+def analyse_fen(fen, max_depth=DEFAULT_DEPTH, time_limit=None, node_limit=None):
+    return analyse_position(GameState.from_fen(fen), max_depth, time_limit, node_limit)
+
+
+def _analyse_line(index, line, limits):
+    """
+    Worker task: result record for one input line, errors are recorded rather than raised
+    """
+    record = {'index': index, 'position': line}
+    try:
+        fields, operations = FENConverter.parse_line(line)
+        if 'id' in operations:
+            record['id'] = operations['id']
+        transposition_table = worker_pool.worker_tables[0] # One per worker process, cleared between positions
+        transposition_table.clear()
+        record.update(analyse_position(GameState.from_fen_fields(fields), transposition_table=transposition_table, **limits))
+    except Exception as error:
+        record['error'] = f'{type(error).__name__}: {error}'
+    return record
+
+
+def completed_indices(output_path):
+    """
+    Indices of the positions that already have a result in output_path.
+    A line cut short by an interrupted run is ignored, so that position is analysed again.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r') as file:
+        for line in file:
+            try:
+                done.add(json.loads(line)['index'])
+            except (ValueError, KeyError):
+                continue
+    return done
+
+
+def analyse_file(input_path, output_path, workers=None, max_depth=DEFAULT_DEPTH, time_limit=None, node_limit=None,
+                 resume=True, hash_mb=16, progress=None):
+    """
+    Analyses every position of input_path on a pool of workers, appending one JSON line per
+    result to output_path as it completes. With resume, positions already in output_path are
+    skipped; otherwise output_path is overwritten. progress, if given, is called with each record.
+    Returns (positions analysed, seconds taken).
+    """
+    done = completed_indices(output_path) if resume else set()
+    if resume and os.path.exists(output_path):
+        _drop_partial_last_line(output_path)
+    limits = {'max_depth': max_depth, 'time_limit': time_limit, 'node_limit': node_limit}
+    tasks = ((index, line, limits) for index, line in enumerate(FENConverter.read_lines(input_path)) if index not in done)
+    start = time.perf_counter()
+
+    with open(output_path, 'a' if resume else 'w') as output:
+        def write_result(record):
+            output.write(json.dumps(record) + '\n')
+            output.flush()
+            if progress is not None:
+                progress(record)
+
+        count = worker_pool.run_tasks(_analyse_line, tasks, workers, worker_pool.init_tables, (hash_mb, 1), write_result)
+    return count, time.perf_counter() - start
+
+
+def _drop_partial_last_line(path):
+    """
+    Cuts off a last line without a newline, left by a run that stopped while writing it.
+    Reads backwards from the end a chunk at a time, so only the tail of the file is read.
+    """
+    with open(path, 'rb+') as file:
+        position = file.seek(0, os.SEEK_END)
+        if position == 0:
+            return
+        file.seek(position - 1)
+        if file.read(1) == b'\n':
+            return
+        while position > 0:
+            size = min(TAIL_CHUNK, position)
+            position -= size
+            file.seek(position)
+            newline = file.read(size).rfind(b'\n')
+            if newline >= 0:
+                file.truncate(position + newline + 1)
+                return
+        file.truncate(0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyse every position of a FEN/EPD file on a pool of engines')
+    parser.add_argument('input', help='FEN or EPD file, one position per line')
+    parser.add_argument('output', help='JSON lines file the results are appended to')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, defaults to the CPU count')
+    parser.add_argument('--depth', type=int, default=None, help=f'search depth, defaults to {DEFAULT_DEPTH} without other limits')
+    parser.add_argument('--movetime', type=int, default=None, help='milliseconds per position')
+    parser.add_argument('--nodes', type=int, default=None, help='nodes per position')
+    parser.add_argument('--hash', type=int, default=16, help='transposition table size per worker in MB')
+    parser.add_argument('--no-resume', action='store_true', help='overwrite the output instead of skipping finished positions')
+    args = parser.parse_args(argv)
+
+    max_depth = args.depth
+    if max_depth is None:
+        max_depth = 64 if args.movetime is not None or args.nodes is not None else DEFAULT_DEPTH
+    time_limit = args.movetime / 1000 if args.movetime is not None else None
+
+    count, seconds = analyse_file(args.input, args.output, args.workers, max_depth, time_limit, args.nodes,
+                                  resume=not args.no_resume, hash_mb=args.hash)
+    print(f'positions {count}  time {seconds:.2f}s  {count / seconds if seconds > 0 else 0:.1f} positions/s')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
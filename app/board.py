@@ -1,6 +1,7 @@
-from app.config import GAME_CONFIG
 from app.fen import FENConverter
 
+DIMENSION = 8
+
 class Board:
     def __init__(self, board_input):
         if isinstance(board_input, str):
@@ -13,26 +14,51 @@ class Board:
             raise TypeError('Use either a FEN string or a Board (list of lists)')
 
     def _init_from_fen_string(self, fen_string):
-        self.fen = fen_string
-        self.board = FENConverter.fen_to_board(self.fen)
+        self._fen = fen_string.split(' ', 1)[0] # Only the placement, the other FEN fields belong to GameState
+        self.board = FENConverter.fen_to_board(self._fen)
+        self._fen_key = self._contents_key()
 
     def _init_from_board_class(self, board_class):
         self.board = board_class.board
-        self.fen = board_class.fen
+        self._fen = None
+        self._fen_key = None
 
     def _init_from_board_list(self, board_list):
         self.board = board_list
-        self.fen = FENConverter.board_to_fen(self.board)
+        self._fen = None
+        self._fen_key = None
+
+    def _contents_key(self):
+        """
+        Snapshot of the squares the cached FEN was built from
+        """
+        return tuple(square for row in self.board for square in row)
+
+    @property
+    def fen(self):
+        """
+        Piece placement FEN, built on first use and built again once any square has changed,
+        however it was written
+        """
+        key = self._contents_key()
+        if key != self._fen_key:
+            self._fen = FENConverter.board_to_fen(self.board)
+            self._fen_key = key
+        return self._fen
 
     def _check_valid_board_list(self, board):
         return (
         isinstance(board, list)
-        and len(board) == GAME_CONFIG.DIMENSION
-        and all(isinstance(inner_list, list) and len(inner_list) == GAME_CONFIG.DIMENSION for inner_list in board)
+        and len(board) == DIMENSION
+        and all(isinstance(inner_list, list) and len(inner_list) == DIMENSION for inner_list in board)
     )
 
     def __eq__(self, other):
-        return self.fen == other.fen
+        if isinstance(other, Board):
+            return self.board == other.board
+        if isinstance(other, list):
+            return self.board == other
+        return NotImplemented
     
     def __getitem__(self, index):
         return self.board[index]
\ No newline at end of file
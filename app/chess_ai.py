@@ -1,65 +1,438 @@
 import random
-from app.projection_engine import Projection
-
-from icecream import ic
+import time
+from app.projection_engine import Projection, Move
+from app.transposition_table import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND, NO_MOVE
+from app.move_ordering import MoveOrderer
+from app.evaluation import PIECE_VALUES
+from app.mailbox import PAWN
+from app.move_encoding import EN_PASSANT, PROMOTION
+from app.tablebase import DRAW as TABLEBASE_DRAW, LOSS as TABLEBASE_LOSS
 
 CHECKMATE_SCORE = 1000
 STALEMATE_SCORE = 0
+DRAW_SCORE = 0 # Repetitions and the fifty-move rule
+
+# SearchAI scores in centipawns, mates as MATE_SCORE less the plies to mate
+MATE_SCORE = 100000
+MATE_THRESHOLD = MATE_SCORE - 1000
 
-piece_score = {
-        "P": 1,
-        "R": 5,
-        "N": 3,
-        "B": 3,
-        "Q": 9,
-        "K": 0,
-    }
+QUIESCENCE_DEPTH = 8 # Most captures quiescence search follows past the main search depth
+DELTA_MARGIN = 200 # Captures that cannot lift the score within this of alpha are skipped
+VALUE_BY_KIND = [0] + [PIECE_VALUES[kind] for kind in 'PNBRQK'] # Indexed by mailbox piece kind
 
 class BasicAI:
-    def __init__(self, game_state):
+    def __init__(self, game_state, opening_book=None, tablebase=None):
         self.gs = game_state
+        self.opening_book = opening_book
+        self.tablebase = tablebase
         self.projection = self.gs.get_projection_at_current_state()
         self.valid_moves = self.projection.get_valid_moves()
 
+    def book_move(self):
+        """
+        A move from the opening book for the current position, None without a book or out of book
+        """
+        if self.opening_book is None:
+            return None
+        return self.opening_book.choose_move(self.gs)
+
+    def move_for_code(self, code):
+        """
+        The root Move with the given code, the search itself works on codes
+        """
+        return next(move for move in self.valid_moves if move.move_id == code)
+
+    def tablebase_move(self):
+        """
+        The best move by the endgame tablebase, None without one or when the material is not covered
+        """
+        if self.tablebase is None or self.projection.piece_count > self.tablebase.max_pieces:
+            return None
+        return self.tablebase.best_move(self.projection)
+
+    def score_material(self):
+        """
+        Material balance in pawns from white's side, kept up to date by the projection
+        """
+        return self.projection.material
+
 
 class RandomAI(BasicAI):
     def find_move(self):
         return random.choice(self.valid_moves)
 
 class GreedyAI(BasicAI):
+    def __init__(self, game_state, transposition_table=None, opening_book=None, tablebase=None):
+        super().__init__(game_state, opening_book, tablebase)
+        self.tt = transposition_table if transposition_table is not None else TranspositionTable()
+
     def find_move(self):
+        book_move = self.book_move() or self.tablebase_move()
+        if book_move is not None:
+            return book_move
         score_factor = 1 if self.projection.white_to_move else -1
-        my_maxscore = CHECKMATE_SCORE
+        my_maxscore = CHECKMATE_SCORE + 1
         best_move = None
-        random.shuffle(self.valid_moves)
-
-        for curr_move in self.valid_moves:
-            self.projection.make_projection(curr_move)
-            opponent_moves = self.projection.get_valid_moves()
-            opponent_maxscore = -CHECKMATE_SCORE
-            for move in opponent_moves:
-                self.projection.make_projection(move)
-                if self.projection.checkmate:
-                    score = -score_factor * CHECKMATE_SCORE
-                elif self.projection.stalemate:
-                    score = STALEMATE_SCORE
-                else:
-                    score = -score_factor * self.score_material()
-                if score > opponent_maxscore:
-                    opponent_maxscore = score
-                self.projection.undo_projection()
+        moves = list(self.projection.generate_legal_moves())
+        random.shuffle(moves)
+        self.tt.new_search()
+
+        for code in moves:
+            self.projection.make_projection(code)
+            opponent_maxscore = self.score_opponent_replies(score_factor, my_maxscore)
             if opponent_maxscore < my_maxscore:
                 my_maxscore = opponent_maxscore
-                best_move = curr_move
+                best_move = code
             self.projection.undo_projection()
-        return best_move
+        return self.move_for_code(best_move) if best_move is not None else None
 
-    def score_material(self):
-        score = 0
-        for row in self.projection.board:
-            for square in row:
-                if square[0] == 'w':
-                    score += piece_score[square[1]]
-                elif square[0] == 'b':
-                    score -= piece_score[square[1]]
-        return score
\ No newline at end of file
+    def score_opponent_replies(self, score_factor, my_maxscore):
+        """
+        Best score the opponent can reach from the projected position, from the opponent's side.
+        Stops at the first reply scoring at least my_maxscore, since the move can no longer be
+        chosen then, and stores that result as a lower bound.
+        """
+        key = self.projection.zobrist_key
+        entry = self.tt.probe(key)
+        tt_move = NO_MOVE
+        if entry is not None:
+            depth, score, bound, tt_move = entry
+            if depth >= 1 and (bound == EXACT or (bound == LOWER_BOUND and score >= my_maxscore)):
+                return score
+
+        opponent_moves = self.projection.generate_legal_moves()
+        if len(opponent_moves) == 0:
+            score = -CHECKMATE_SCORE if self.projection.is_check() else STALEMATE_SCORE
+            self.tt.store(key, 1, score, EXACT)
+            return score
+        if tt_move != NO_MOVE: # Try the stored best reply first, it is the likeliest refutation
+            opponent_moves = sorted(opponent_moves, key=lambda code: code != tt_move)
+
+        opponent_maxscore = -CHECKMATE_SCORE - 1
+        best_reply = NO_MOVE
+        bound = EXACT
+        for code in opponent_moves:
+            self.projection.make_projection(code)
+            score = self.score_leaf(score_factor)
+            self.projection.undo_projection()
+            if score > opponent_maxscore:
+                opponent_maxscore = score
+                best_reply = code
+            if opponent_maxscore >= my_maxscore:
+                bound = LOWER_BOUND
+                break
+        self.tt.store(key, 1, opponent_maxscore, bound, best_reply)
+        return opponent_maxscore
+
+    def score_leaf(self, score_factor):
+        """
+        Score of the projected position from the opponent's side, memoised in the table
+        from the side of the team to move. Repeated positions score as draws and are not
+        memoised, since that depends on how the position was reached.
+        """
+        if self.projection.is_repetition() or self.projection.is_fifty_move_draw():
+            return DRAW_SCORE
+        key = self.projection.zobrist_key
+        entry = self.tt.probe(key)
+        if entry is not None and entry[2] == EXACT:
+            return -entry[1]
+
+        if self.projection.is_checkmate():
+            score = CHECKMATE_SCORE
+        elif self.projection.is_stalemate():
+            score = STALEMATE_SCORE
+        else:
+            score = -score_factor * self.score_material()
+        self.tt.store(key, 0, -score, EXACT)
+        return score
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside SearchAI when its time or node budget runs out
+    """
+
+
+class SearchAI(BasicAI):
+    """
+    Negamax search with alpha-beta pruning and iterative deepening.
+
+    Searches one ply deeper per iteration up to max_depth. When time_limit (seconds)
+    or node_limit runs out, or stop() is called from another thread, the best move of
+    the deepest searched root moves is returned. best_score and depth_reached then
+    describe that move, from the unfinished iteration if it found one. info_callback,
+    if given, is called with search_info() after every completed iteration.
+
+    Leaves are scored by a quiescence search through captures and promotions, at most
+    quiescence_depth plies deep, so the score is not taken in the middle of an exchange.
+    quiescence_depth=0 scores leaves with the static evaluation.
+
+    Inside the tree moves are the 16-bit codes of generate_legal_moves, Move objects are
+    only built for the result and the principal variation.
+
+    opening_book, an OpeningBook, is probed before searching and its move played while in book.
+    tablebase, a Tablebase, gives the move outright once the material is covered, and scores
+    positions inside the tree that reach covered material without searching them.
+    """
+    def __init__(self, game_state, max_depth=4, time_limit=None, node_limit=None, transposition_table=None,
+                 info_callback=None, quiescence_depth=QUIESCENCE_DEPTH, opening_book=None, tablebase=None):
+        super().__init__(game_state, opening_book, tablebase)
+        self.max_depth = max_depth
+        self.quiescence_depth = quiescence_depth
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.info_callback = info_callback
+        self.stop_requested = False
+        self.tt = transposition_table if transposition_table is not None else TranspositionTable()
+        self.orderer = MoveOrderer(self.projection.squares, static_exchange=self.projection.static_exchange)
+        self.nodes = 0
+        self.depth_reached = 0
+        self.best_score = 0
+        self.start_time = 0
+
+    def find_move(self):
+        if len(self.valid_moves) == 0:
+            return None
+        book_move = self.book_move() or self.tablebase_move()
+        if book_move is not None:
+            self.nodes = 0
+            self.depth_reached = 0
+            self.best_score = 0
+            return book_move
+        self.tt.new_search()
+        self.orderer.new_search()
+        self.nodes = 0
+        self.depth_reached = 0
+        self.start_time = time.perf_counter()
+        root_ply = len(self.projection.projection_log)
+        best_move = self.valid_moves[0].move_id
+
+        for depth in range(1, self.max_depth + 1):
+            self.iteration_best_move = None
+            try:
+                self.best_score = self.negamax(depth, -MATE_SCORE - 1, MATE_SCORE + 1, 0)
+            except SearchTimeout:
+                # Unwind the projection, the previous best move is searched first so any
+                # root move that finished beating it is still an improvement
+                while len(self.projection.projection_log) > root_ply:
+                    self.projection.undo_projection()
+                if self.iteration_best_move is not None: # Report the score and depth that move was found at
+                    best_move = self.iteration_best_move
+                    self.best_score = self.iteration_best_score
+                    self.depth_reached = depth
+                    # Root entry so the principal variation starts with the move, a lower bound as
+                    # the other root moves were not all searched
+                    self.tt.store(self.projection.zobrist_key, depth, self.best_score, LOWER_BOUND, best_move)
+                    if self.info_callback is not None:
+                        self.info_callback(self.search_info())
+                break
+            best_move = self.iteration_best_move
+            self.depth_reached = depth
+            if self.info_callback is not None:
+                self.info_callback(self.search_info())
+            if abs(self.best_score) >= MATE_THRESHOLD: # Forced mate found, deeper search cannot change it
+                break
+        return self.move_for_code(best_move)
+
+    def stop(self):
+        """
+        Asks a running search to return its best move so far, safe to call from another thread
+        """
+        self.stop_requested = True
+
+    def check_budget(self):
+        if self.stop_requested:
+            raise SearchTimeout()
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchTimeout()
+        if self.time_limit is not None and time.perf_counter() - self.start_time >= self.time_limit:
+            raise SearchTimeout()
+
+    def negamax(self, depth, alpha, beta, ply):
+        """
+        Score of the projected position from the side of the team to move
+        """
+        self.nodes += 1
+        if self.nodes & 63 == 0:
+            self.check_budget()
+
+        # A position seen before in the game or the line searched could be repeated forever, so it
+        # is scored as a draw straight away, as is one where the fifty-move rule can be claimed
+        if ply > 0 and (self.projection.is_repetition() or self.projection.is_fifty_move_draw()):
+            return DRAW_SCORE
+
+        if ply > 0 and self.tablebase is not None and self.projection.piece_count <= self.tablebase.max_pieces:
+            value = self.tablebase.probe(self.projection)
+            if value is not None:
+                return self.tablebase_score(value, ply)
+
+        key = self.projection.zobrist_key
+        alpha_orig = alpha
+        tt_move = NO_MOVE
+        entry = self.tt.probe(key)
+        if entry is not None:
+            entry_depth, score, bound, tt_move = entry
+            if entry_depth >= depth and ply > 0:
+                score = self.score_from_tt(score, ply)
+                if bound == EXACT:
+                    return score
+                if bound == LOWER_BOUND and score >= beta:
+                    return score
+                if bound == UPPER_BOUND and score <= alpha:
+                    return score
+
+        if depth <= 0:
+            return self.quiescence(alpha, beta, ply, 0)
+
+        moves = self.projection.generate_legal_moves()
+        if len(moves) == 0:
+            return -(MATE_SCORE - ply) if self.projection.is_check() else STALEMATE_SCORE
+        moves = self.orderer.order(moves, ply, tt_move)
+
+        best_score = -MATE_SCORE - 1
+        best_move = NO_MOVE
+        for i, code in enumerate(moves):
+            self.projection.make_projection(code)
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            self.projection.undo_projection()
+            if score > best_score:
+                best_score = score
+                best_move = code
+                if ply == 0:
+                    self.iteration_best_move = code
+                    self.iteration_best_score = score
+            if best_score > alpha:
+                alpha = best_score
+            if alpha >= beta:
+                self.orderer.record_cutoff(code, ply, depth, i)
+                break
+
+        if best_score <= alpha_orig:
+            bound = UPPER_BOUND
+        elif best_score >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.tt.store(key, depth, self.score_to_tt(best_score, ply), bound, best_move)
+        return best_score
+
+    def quiescence(self, alpha, beta, ply, quiescence_ply):
+        """
+        Score of the projected position once captures and promotions have played out.
+        The side to move may stand pat on the static evaluation instead of capturing,
+        unless it is in check, in which case every evasion is searched. Out of check only
+        captures and promotions are generated, so stalemate is not detected here.
+        """
+        if quiescence_ply > 0:
+            self.nodes += 1
+            if self.nodes & 63 == 0:
+                self.check_budget()
+
+        stand_pat = self.evaluate()
+        if quiescence_ply >= self.quiescence_depth:
+            return stand_pat
+
+        in_check = self.projection.is_check()
+        if in_check:
+            moves = self.projection.generate_legal_moves()
+            if len(moves) == 0:
+                return -(MATE_SCORE - ply)
+            best_score = -MATE_SCORE - 1
+        else:
+            if stand_pat >= beta:
+                return stand_pat # Cut off before generating anything
+            best_score = stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+            moves = self.projection.generate_legal_moves(captures_only=True)
+        moves = self.orderer.order_captures(moves)
+
+        squares = self.projection.squares
+        for code in moves:
+            flag = code >> 12
+            if not in_check and not flag & PROMOTION:
+                victim = PAWN if flag == EN_PASSANT else squares[(code >> 6) & 63] & 7
+                if stand_pat + VALUE_BY_KIND[victim] + DELTA_MARGIN <= alpha:
+                    continue # Delta pruning: even winning the piece outright leaves the score below alpha
+                if squares[code & 63] & 7 > victim and self.projection.static_exchange(code) < 0:
+                    continue # Loses material once the recaptures are played out
+            self.projection.make_projection(code)
+            score = -self.quiescence(-beta, -alpha, ply + 1, quiescence_ply + 1)
+            self.projection.undo_projection()
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return best_score
+
+    @staticmethod
+    def tablebase_score(value, ply):
+        """
+        Search score of a tablebase DTM value found ply plies from the root
+        """
+        if value == TABLEBASE_DRAW:
+            return DRAW_SCORE
+        if value >= TABLEBASE_LOSS:
+            return -(MATE_SCORE - ply - (value - TABLEBASE_LOSS))
+        return MATE_SCORE - ply - value
+
+    def principal_variation(self, max_length=None):
+        """
+        Expected line from the root, following the best moves stored in the transposition table
+        """
+        if max_length is None:
+            max_length = self.depth_reached
+        pv = []
+        seen = set()
+        while len(pv) < max_length and self.projection.zobrist_key not in seen:
+            seen.add(self.projection.zobrist_key)
+            tt_move = self.tt.best_move(self.projection.zobrist_key)
+            if tt_move not in self.projection.generate_legal_moves():
+                break
+            pv.append(Move.from_code(tt_move, self.projection.board))
+            self.projection.make_projection(tt_move)
+        for _ in pv:
+            self.projection.undo_projection()
+        return pv
+
+    def search_info(self):
+        """
+        Progress of the search: depth, score, nodes, time, nodes/sec and principal variation
+        """
+        elapsed = time.perf_counter() - self.start_time
+        return {
+            'depth': self.depth_reached,
+            'score': self.best_score,
+            'nodes': self.nodes,
+            'time': elapsed,
+            'nps': int(self.nodes / elapsed) if elapsed > 0 else 0,
+            'pv': self.principal_variation(),
+        }
+
+    def evaluate(self):
+        """
+        Material and piece-square score in centipawns from the side of the team to move
+        """
+        score_factor = 1 if self.projection.white_to_move else -1
+        return score_factor * self.projection.psq_score
+
+    @staticmethod
+    def score_to_tt(score, ply):
+        """
+        Mate scores are stored as distance from the stored position rather than from the root
+        """
+        if score >= MATE_THRESHOLD:
+            return score + ply
+        if score <= -MATE_THRESHOLD:
+            return score - ply
+        return score
+
+    @staticmethod
+    def score_from_tt(score, ply):
+        if score >= MATE_THRESHOLD:
+            return score - ply
+        if score <= -MATE_THRESHOLD:
+            return score + ply
+        return score
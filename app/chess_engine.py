@@ -1,6 +1,21 @@
+"""
+Headless chess engine.
+
+Everything needed to play or analyse games without the pygame interface:
+positions, move generation, FEN handling and the AIs. Nothing imported here
+pulls in pygame or app.config, so worker processes can import it in a few
+milliseconds without opening a window.
+
+    from app.chess_engine import GameState, GreedyAI
+"""
+from app.fen import FENConverter, FENFields
+from app.board import Board
 from app.game_state import GameState
+from app.projection_engine import Projection, Move, CastlingRights
+from app.chess_ai import BasicAI, RandomAI, GreedyAI, SearchAI, SearchTimeout
+from app.transposition_table import TranspositionTable
 
-class ChessEngine(GameState):
-    def __init__(self):
-        pass
-    # to refactor chess_game to separate pygame logic from game engine
\ No newline at end of file
+__all__ = [
+    'FENConverter', 'FENFields', 'Board', 'GameState', 'Projection', 'Move', 'CastlingRights',
+    'BasicAI', 'RandomAI', 'GreedyAI', 'SearchAI', 'SearchTimeout', 'TranspositionTable',
+]
@@ -2,22 +2,18 @@ import pygame
 
 from app.config import GAME_CONFIG
 from app.game_state import GameState
-from app.projection_engine import Move
 from app.chess_ai import RandomAI, GreedyAI # find_random_move, find_greedy_move
-
-from multiprocessing import Process, Queue
-
+from app.ai_worker import AIWorker
+from app.fen import castling_board
 
 from icecream import ic
 
-castling_board = 'rnbqk2r/pppp1ppp/5n2/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R'
-
-
 class ChessGame:
     def __init__(self) -> None:
-        pass
+        self.ai_worker = AIWorker(GreedyAI) # Keeps its transposition table for every AI move of the game
 
     def run(self):
+        GAME_CONFIG.WIN # Opens the window before the first events are read
         GAME_CONFIG.reset_clock()
         run = True
         gs = GameState(castling_board)
@@ -25,6 +21,7 @@ class ChessGame:
         sq_selected = ()
         player_clicks = []
         move_made = False
+        do_animation = False
         suspend_moving = False
         game_over = False
 
@@ -37,7 +34,7 @@ class ChessGame:
                     run = False
                 
                 # MOUSE CLICKS
-                elif event.type == pygame.MOUSEBUTTONDOWN:
+                elif event.type == pygame.MOUSEBUTTONDOWN and player_turn:
                     location = pygame.mouse.get_pos()
                     col = location[0] // GAME_CONFIG.TILE_WIDTH
                     row = location[1] // GAME_CONFIG.TILE_WIDTH
@@ -49,11 +46,11 @@ class ChessGame:
                         player_clicks.append(sq_selected)
                     
                     if len(player_clicks) == 2: # Second click submitted
-                        move = Move(player_clicks[0], player_clicks[1], gs.board)
-                        
                         for i in range(len(valid_moves)):
-                            if move == valid_moves[i]: # use this check in order to take moves from valid moves instead of mouse click
+                            # Match on squares, a Move built from the clicks would not know it is castling or en passant
+                            if valid_moves[i].start_sq == player_clicks[0] and valid_moves[i].end_sq == player_clicks[1]:
                                 gs.make_move(valid_moves[i])
+                                print(valid_moves[i].get_chess_notation())
                                 move_made = True
                                 do_animation = True
                                 sq_selected = ()
@@ -65,7 +62,7 @@ class ChessGame:
                 # KEYBOARD PRESSES
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_z:
-                        
+                        self.ai_worker.cancel()
                         gs.undo_move()
                         if not (GAME_CONFIG.PLAYER_WHITE and GAME_CONFIG.PLAYER_BLACK):
                             gs.undo_move() # extra undo if computer player
@@ -78,6 +75,7 @@ class ChessGame:
                         GAME_CONFIG.reset_clock()
                         run = True
                         gs = GameState()
+                        self.ai_worker.close() # Cancels any search and starts the next game with an empty table
                         valid_moves = gs.get_valid_moves()
                         sq_selected = ()
                         player_clicks = []
@@ -86,14 +84,15 @@ class ChessGame:
             
             # AI MOVE FINDER
             if not suspend_moving and not game_over and not player_turn:
-                # ai = RandomAI(gs)
-                ai = GreedyAI(gs)
-                # ai_move = find_greedy_move(gs, valid_moves)
-                ai_move = None
-                if not ai_move:
-                    ai_move = ai.find_move()
-                gs.make_move(ai_move)
-                move_made = True
+                if not self.ai_worker.searching:
+                    self.ai_worker.request_move(gs)
+                ai_move = self.ai_worker.poll() # None until the worker has answered, the board keeps drawing meanwhile
+                if ai_move:
+                    ai_move = valid_moves[valid_moves.index(ai_move)] # The worker sends back a copy
+                    gs.make_move(ai_move)
+                    print(ai_move.get_chess_notation())
+                    move_made = True
+                    do_animation = True
 
             # ANIMATE MOVE
             if move_made:
@@ -115,10 +114,17 @@ class ChessGame:
             elif gs.stalemate:
                 game_over = True
                 self._draw_text('Stalemate.')
+            elif gs.threefold_repetition:
+                game_over = True
+                self._draw_text('Draw by threefold repetition.')
+            elif gs.fifty_move_draw:
+                game_over = True
+                self._draw_text('Draw by the fifty-move rule.')
 
 
 
             pygame.display.flip()
+        self.ai_worker.close()
         pygame.quit()
 
     def _draw_gamestate(self, gs, valid_moves, sq_selected):
@@ -1,7 +1,6 @@
-import pygame, json
+import json, os
 from dataclasses import dataclass
-
-from icecream import ic
+from functools import cached_property
 
 # class GameConfig:
 
@@ -36,6 +35,11 @@ from icecream import ic
 
 @dataclass
 class GameConfig:
+    """
+    Settings for the pygame interface.
+    The window, clock and piece images are only created the first time they are used,
+    so importing the config does not import pygame or open a window.
+    """
     DIMENSION: int
     TILE_WIDTH: int
     LIGHT: str
@@ -49,19 +53,31 @@ class GameConfig:
 
     def __post_init__(self):
         self.BOARD_WIDTH = self.TILE_WIDTH * self.DIMENSION
-        self.WIN = pygame.display.set_mode((self.BOARD_WIDTH, self.BOARD_WIDTH))
-        pygame.display.set_caption(self.CAPTION)
-        self.CLOCK = pygame.time.Clock()
         self.PIECES = ['bB', 'bK', 'bN', 'bP', 'bQ', 'bR', 'wB', 'wK', 'wN', 'wP', 'wQ', 'wR']
-        self.IMAGES = {}
-        for piece in self.PIECES:
-            self.IMAGES[piece] = pygame.image.load(self.ASSETS_FOLDER + piece + '.png')
+
+    @cached_property
+    def WIN(self):
+        import pygame
+        win = pygame.display.set_mode((self.BOARD_WIDTH, self.BOARD_WIDTH))
+        pygame.display.set_caption(self.CAPTION)
+        return win
+
+    @cached_property
+    def CLOCK(self):
+        import pygame
+        return pygame.time.Clock()
+
+    @cached_property
+    def IMAGES(self):
+        import pygame
+        return {piece: pygame.image.load(self.ASSETS_FOLDER + piece + '.png') for piece in self.PIECES}
 
     def reset_clock(self):
+        import pygame
         self.CLOCK = pygame.time.Clock()
 
 
-json_file_path = 'app/config.json'
+json_file_path = os.path.join(os.path.dirname(__file__), 'config.json')
 with open(json_file_path, 'r') as json_file:
     config_data = json.load(json_file)
 GAME_CONFIG = GameConfig(**config_data)
@@ -0,0 +1,138 @@
+"""
+Material and piece-square evaluation.
+
+Both totals are kept from white's side: white pieces add, black pieces subtract.
+Projection keeps running totals up to date with move_delta, so reading the
+score of a position costs O(1) instead of a scan of the board.
+"""
+from app.mailbox import PIECE_CODES, EMPTY, KNIGHT, ROOK, BLACK_BIT
+from app.move_encoding import KING_CASTLE, QUEEN_CASTLE, EN_PASSANT, PROMOTION
+
+# Material in pawns, as used by GreedyAI
+piece_score = {
+        "P": 1,
+        "R": 5,
+        "N": 3,
+        "B": 3,
+        "Q": 9,
+        "K": 0,
+    }
+
+# Material in centipawns for the piece-square score
+PIECE_VALUES = {'P': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 0}
+
+# Piece-square bonuses for white, row 0 is the 8th rank. Black uses the rows mirrored.
+PIECE_SQUARE_TABLES = {
+    'P': [
+          0,  0,  0,  0,  0,  0,  0,  0,
+         50, 50, 50, 50, 50, 50, 50, 50,
+         10, 10, 20, 30, 30, 20, 10, 10,
+          5,  5, 10, 25, 25, 10,  5,  5,
+          0,  0,  0, 20, 20,  0,  0,  0,
+          5, -5,-10,  0,  0,-10, -5,  5,
+          5, 10, 10,-20,-20, 10, 10,  5,
+          0,  0,  0,  0,  0,  0,  0,  0],
+    'N': [
+        -50,-40,-30,-30,-30,-30,-40,-50,
+        -40,-20,  0,  0,  0,  0,-20,-40,
+        -30,  0, 10, 15, 15, 10,  0,-30,
+        -30,  5, 15, 20, 20, 15,  5,-30,
+        -30,  0, 15, 20, 20, 15,  0,-30,
+        -30,  5, 10, 15, 15, 10,  5,-30,
+        -40,-20,  0,  5,  5,  0,-20,-40,
+        -50,-40,-30,-30,-30,-30,-40,-50],
+    'B': [
+        -20,-10,-10,-10,-10,-10,-10,-20,
+        -10,  0,  0,  0,  0,  0,  0,-10,
+        -10,  0,  5, 10, 10,  5,  0,-10,
+        -10,  5,  5, 10, 10,  5,  5,-10,
+        -10,  0, 10, 10, 10, 10,  0,-10,
+        -10, 10, 10, 10, 10, 10, 10,-10,
+        -10,  5,  0,  0,  0,  0,  5,-10,
+        -20,-10,-10,-10,-10,-10,-10,-20],
+    'R': [
+          0,  0,  0,  0,  0,  0,  0,  0,
+          5, 10, 10, 10, 10, 10, 10,  5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+          0,  0,  0,  5,  5,  0,  0,  0],
+    'Q': [
+        -20,-10,-10, -5, -5,-10,-10,-20,
+        -10,  0,  0,  0,  0,  0,  0,-10,
+        -10,  0,  5,  5,  5,  5,  0,-10,
+         -5,  0,  5,  5,  5,  5,  0, -5,
+          0,  0,  5,  5,  5,  5,  0, -5,
+        -10,  5,  5,  5,  5,  5,  0,-10,
+        -10,  0,  5,  0,  0,  0,  0,-10,
+        -20,-10,-10, -5, -5,-10,-10,-20],
+    'K': [
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -20,-30,-30,-40,-40,-30,-30,-20,
+        -10,-20,-20,-20,-20,-20,-20,-10,
+         20, 20,  0,  0,  0,  0, 20, 20,
+         20, 30, 10,  0,  0, 10, 30, 20],
+}
+
+# Signed lookups by piece string, e.g. MATERIAL['bQ'] == -9 and PSQ['wN'][r * 8 + c]
+MATERIAL = {'--': 0}
+PSQ = {}
+for kind, table in PIECE_SQUARE_TABLES.items():
+    MATERIAL['w' + kind] = piece_score[kind]
+    MATERIAL['b' + kind] = -piece_score[kind]
+    PSQ['w' + kind] = [PIECE_VALUES[kind] + table[sq] for sq in range(64)]
+    PSQ['b' + kind] = [-(PIECE_VALUES[kind] + table[(7 - sq // 8) * 8 + sq % 8]) for sq in range(64)]
+
+# The same lookups by mailbox piece code, for Projection's flat board. The empty square counts 0.
+MATERIAL_BY_CODE = [0] * 16
+PSQ_BY_CODE = [[0] * 64 for _ in range(16)]
+for piece, code in PIECE_CODES.items():
+    if code != EMPTY:
+        MATERIAL_BY_CODE[code] = MATERIAL[piece]
+        PSQ_BY_CODE[code] = PSQ[piece]
+
+
+def evaluate_board(board):
+    """
+    Returns (material, piece-square score) of a board from scratch
+    """
+    material = 0
+    psq_score = 0
+    for r in range(8):
+        row = board[r]
+        for c in range(8):
+            piece = row[c]
+            if piece != '--':
+                material += MATERIAL[piece]
+                psq_score += PSQ[piece][r * 8 + c]
+    return material, psq_score
+
+
+def move_delta(code, piece, captured):
+    """
+    Returns how much a move changes (material, piece-square score), from its 16-bit code,
+    the mailbox code of the piece moved and of the piece captured (0 for none).
+    Add it when making the move and subtract it when undoing it.
+    """
+    start = code & 63
+    end = (code >> 6) & 63
+    flag = code >> 12
+    placed = (KNIGHT + (flag & 3)) | (piece & BLACK_BIT) if flag & PROMOTION else piece
+    material = MATERIAL_BY_CODE[placed] - MATERIAL_BY_CODE[piece] - MATERIAL_BY_CODE[captured]
+    psq_score = PSQ_BY_CODE[placed][end] - PSQ_BY_CODE[piece][start]
+
+    if captured:
+        captured_sq = (start & 56) | (end & 7) if flag == EN_PASSANT else end
+        psq_score -= PSQ_BY_CODE[captured][captured_sq]
+    elif flag == KING_CASTLE:
+        rook_table = PSQ_BY_CODE[ROOK | (piece & BLACK_BIT)]
+        psq_score += rook_table[start + 1] - rook_table[start + 3]
+    elif flag == QUEEN_CASTLE:
+        rook_table = PSQ_BY_CODE[ROOK | (piece & BLACK_BIT)]
+        psq_score += rook_table[start - 1] - rook_table[start - 4]
+    return material, psq_score
@@ -1,3 +1,34 @@
+"""
+FEN and EPD parsing and serialisation.
+
+A FEN has six space separated fields: piece placement, side to move, castling
+rights, en passant square, halfmove clock and fullmove number. An EPD has the
+first four, followed by operations such as bm e4; id "test 1";
+"""
+from typing import NamedTuple
+
+castling_board = 'rnbqk2r/pppp1ppp/5n2/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R' # Both sides can castle either way
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# Squares the king and rook need to be on for each castling right, as (row, col)
+CASTLING_HOMES = {
+    'K': ((7, 4, 'wK'), (7, 7, 'wR')),
+    'Q': ((7, 4, 'wK'), (7, 0, 'wR')),
+    'k': ((0, 4, 'bK'), (0, 7, 'bR')),
+    'q': ((0, 4, 'bK'), (0, 0, 'bR')),
+}
+
+
+class FENFields(NamedTuple):
+    board: list # 8x8 list of piece strings
+    white_to_move: bool
+    castling: str # 'KQkq', '-' for none
+    en_passant: tuple # (row, col), () for none
+    halfmove_clock: int
+    fullmove_number: int
+
+
 class FENConverter:
     piece_lookup = {
         'r' : 'bR',
@@ -26,25 +57,40 @@ class FENConverter:
         'wP' : 'P' 
     }
 
+    _rank_cache = {} # Rank string to its 8 squares, ranks repeat a lot across a file of positions
+
     @classmethod
     def fen_to_board(cls, fen_string):
+        """
+        8x8 board for the piece placement field, the other fields are ignored if present
+        """
+        ranks = fen_string.split(' ', 1)[0].split('/')
+        if len(ranks) != 8:
+            raise ValueError(f'FEN placement needs 8 ranks: {fen_string}')
         board = []
-        ranks = fen_string.split('/')
-        for rank in range(8):
-            board_file = [] 
-            board_file_cur = 0
-            for s in ranks[rank]:
-                if s.isnumeric():
-                    for _ in range(int(s)):
-                        board_file.append('--')
-                        board_file_cur += 1
-                else:
-                    piece = cls.piece_lookup[s]
-                    board_file.append(piece)
-                    board_file_cur += 1
-            board.append(board_file)
+        for rank in ranks:
+            squares = cls._rank_cache.get(rank)
+            if squares is None:
+                squares = cls._parse_rank(rank)
+                if len(cls._rank_cache) < 100_000:
+                    cls._rank_cache[rank] = squares
+            board.append(list(squares))
         return board
 
+    @classmethod
+    def _parse_rank(cls, rank):
+        squares = []
+        for s in rank:
+            if s.isnumeric():
+                squares.extend(['--'] * int(s))
+            elif s in cls.piece_lookup:
+                squares.append(cls.piece_lookup[s])
+            else:
+                raise ValueError(f'Unknown piece {s!r} in FEN rank {rank!r}')
+        if len(squares) != 8:
+            raise ValueError(f'FEN rank {rank!r} does not have 8 squares')
+        return tuple(squares)
+
     @classmethod
     def board_to_fen(cls, board):
         fen_string = ''
@@ -67,3 +113,133 @@ class FENConverter:
             else:
                 fen_string += '/' + fen_rank
         return fen_string
+
+    @staticmethod
+    def square_to_algebraic(square):
+        """
+        (row, col) to 'e3', () to '-'
+        """
+        if not square:
+            return '-'
+        return 'abcdefgh'[square[1]] + str(8 - square[0])
+
+    @staticmethod
+    def algebraic_to_square(text):
+        """
+        'e3' to (row, col), '-' to ()
+        """
+        if text == '-':
+            return ()
+        if len(text) != 2 or text[0] not in 'abcdefgh' or text[1] not in '12345678':
+            raise ValueError(f'Invalid square {text!r}')
+        return (8 - int(text[1]), 'abcdefgh'.index(text[0]))
+
+    @classmethod
+    def _parse_position_fields(cls, fields, halfmove_clock=0, fullmove_number=1):
+        """
+        Raises ValueError unless each side has exactly one king.
+        Castling rights whose king or rook is not on its home square are dropped.
+        """
+        if not fields:
+            raise ValueError('Empty FEN')
+        board = cls.fen_to_board(fields[0])
+        for king in ('wK', 'bK'):
+            count = sum(row.count(king) for row in board)
+            if count != 1:
+                raise ValueError(f"FEN needs one {'white' if king == 'wK' else 'black'} king, not {count}: {fields[0]}")
+        side = fields[1] if len(fields) > 1 else 'w'
+        if side not in ('w', 'b'):
+            raise ValueError(f'Side to move must be w or b, not {side!r}')
+        castling = fields[2] if len(fields) > 2 else '-'
+        if castling != '-' and (not castling or any(right not in 'KQkq' for right in castling)):
+            raise ValueError(f'Invalid castling rights {castling!r}')
+        castling = ''.join(right for right in castling if right != '-' and all(
+            board[r][c] == piece for r, c, piece in CASTLING_HOMES[right])) or '-'
+        en_passant = cls.algebraic_to_square(fields[3]) if len(fields) > 3 else ()
+        return FENFields(board, side == 'w', castling, en_passant, halfmove_clock, fullmove_number)
+
+    @classmethod
+    def parse_fen(cls, fen):
+        """
+        FENFields for a FEN. Missing trailing fields default to white to move, no castling,
+        no en passant square and clocks 0 and 1.
+        """
+        fields = fen.split()
+        halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+        fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        return cls._parse_position_fields(fields, halfmove_clock, fullmove_number)
+
+    @classmethod
+    def to_fen(cls, board, white_to_move=True, castling='-', en_passant=(), halfmove_clock=0, fullmove_number=1):
+        return (f"{cls.board_to_fen(board)} {'w' if white_to_move else 'b'} {castling or '-'} "
+                f"{cls.square_to_algebraic(en_passant)} {halfmove_clock} {fullmove_number}")
+
+    @classmethod
+    def parse_epd(cls, epd):
+        """
+        (FENFields, operations) for an EPD line. Operations map each opcode to its operand
+        string, with quotes removed, e.g. {'bm': 'Nf3', 'id': 'test 1'}. The hmvc and fmvn
+        operations fill in the clocks.
+        """
+        fields = epd.split(None, 4)
+        operations = cls._parse_epd_operations(fields[4]) if len(fields) > 4 else {}
+        halfmove_clock = int(operations.get('hmvc', 0))
+        fullmove_number = int(operations.get('fmvn', 1))
+        return cls._parse_position_fields(fields[:4], halfmove_clock, fullmove_number), operations
+
+    @staticmethod
+    def _parse_epd_operations(text):
+        operations = {}
+        for operation in text.split(';'):
+            operation = operation.strip()
+            if not operation:
+                continue
+            opcode, _, operand = operation.partition(' ')
+            operations[opcode] = operand.strip().strip('"')
+        return operations
+
+    @classmethod
+    def to_epd(cls, board, white_to_move=True, castling='-', en_passant=(), operations=None):
+        epd = f"{cls.board_to_fen(board)} {'w' if white_to_move else 'b'} {castling or '-'} {cls.square_to_algebraic(en_passant)}"
+        for opcode, operand in (operations or {}).items():
+            if operand == '' or operand is None:
+                epd += f' {opcode};'
+            elif ' ' in str(operand) or opcode == 'id':
+                epd += f' {opcode} "{operand}";'
+            else:
+                epd += f' {opcode} {operand};'
+        return epd
+
+    @classmethod
+    def parse_line(cls, line):
+        """
+        (FENFields, operations) for a FEN or EPD line, told apart by whether the fields
+        after the fourth are the clocks. A FEN may leave out the fullmove number.
+        """
+        fields = line.split()
+        if len(fields) in (5, 6) and all(field.isdigit() for field in fields[4:]):
+            return cls._parse_position_fields(fields, int(fields[4]), int(fields[5]) if len(fields) > 5 else 1), {}
+        return cls.parse_epd(line)
+
+    @classmethod
+    def read_file(cls, path):
+        """
+        Yields (FENFields, operations) for every FEN or EPD line of a file, one line at a time
+        so files of millions of positions never need to fit in memory.
+        Blank lines and lines starting with # are skipped.
+        """
+        parse_line = cls.parse_line
+        for line in cls.read_lines(path):
+            yield parse_line(line)
+
+    @staticmethod
+    def read_lines(path):
+        """
+        Yields the position lines of a FEN/EPD file unparsed and stripped, skipping blank and # lines,
+        for callers that parse each line elsewhere
+        """
+        with open(path, 'r') as file:
+            for line in file:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield line
@@ -1,44 +1,163 @@
 from app.board import Board
-from app.projection_engine import Projection, CastlingRights
-
-from icecream import ic
+from app.fen import FENConverter
+from app.projection_engine import Projection, Move, CastlingRights
+from app import zobrist
+from app import evaluation
 
 class GameState:
     def __init__(self, board=None):
         self.board = Board(board) if board else Board('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR')
         self.white_to_move = True
         self.move_log = []
-        self.white_king_pos = (7,4)
-        self.black_king_pos = (0,4)
+        self.white_king_pos, self.black_king_pos = self._find_king_positions()
         self.en_passant_possible = ()
-        self.en_passant_log = []
+        self.en_passant_log = [()]
         self.curr_castling_rights = CastlingRights()
-        self.castling_rights_log = [CastlingRights()]
+        self.castling_log = [self.curr_castling_rights.to_bits()] # Rights after each move as bits, for Projection
+        self.captured_log = [] # Mailbox code of the piece each move captured, 0 for none
         self.in_check = False
         self.checkmate = False
         self.stalemate = False
+        self.threefold_repetition = False
+        self.fifty_move_draw = False
+        self.zobrist_key = zobrist.hash_position(self.board, self.white_to_move, self.curr_castling_rights, self.en_passant_possible)
+        self.zobrist_log = [self.zobrist_key]
+        self.material, self.psq_score = evaluation.evaluate_board(self.board)
+        self.piece_count = sum(square != '--' for row in self.board for square in row) # Kings included
+        self.halfmove_clock = 0 # Plies since the last capture or pawn move
+        self.halfmove_log = [0]
+        self.fullmove_number = 1
+        self._projection = None # Shared by make_move and undo_move, see _shared_projection
+
+
+    @classmethod
+    def from_fen(cls, fen):
+        """
+        GameState for a FEN, all six fields are used
+        """
+        return cls.from_fen_fields(FENConverter.parse_fen(fen))
+
+    @classmethod
+    def from_fen_fields(cls, fields):
+        """
+        GameState for FENFields, as returned by FENConverter.parse_fen, parse_epd and read_file
+        """
+        game_state = cls(fields.board)
+        game_state.white_to_move = fields.white_to_move
+        game_state.curr_castling_rights = CastlingRights('K' in fields.castling, 'Q' in fields.castling,
+                                                         'k' in fields.castling, 'q' in fields.castling)
+        game_state.castling_log = [game_state.curr_castling_rights.to_bits()]
+        game_state.en_passant_possible = fields.en_passant
+        game_state.en_passant_log = [fields.en_passant]
+        game_state.halfmove_clock = fields.halfmove_clock
+        game_state.halfmove_log = [fields.halfmove_clock]
+        game_state.fullmove_number = fields.fullmove_number
+        # __init__ hashed the pieces with white to move, full castling rights and no en passant
+        key = game_state.zobrist_key ^ zobrist.castling_key(CastlingRights()) ^ zobrist.castling_key(game_state.curr_castling_rights)
+        if not game_state.white_to_move:
+            key ^= zobrist.BLACK_TO_MOVE_KEY
+        key ^= zobrist.en_passant_key(game_state.board, game_state.en_passant_possible, game_state.white_to_move)
+        game_state.zobrist_key = key
+        game_state.zobrist_log = [key]
+        # Check, mate and draw status of the loaded position
+        game_state._update_attributes_from_projection(game_state._shared_projection())
+        return game_state
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_projection'] = None # Built again on first use after unpickling
+        return state
+
+    def castling_fen(self):
+        """
+        Castling rights as in a FEN, e.g. 'KQk', '-' for none
+        """
+        return self.curr_castling_rights.to_fen()
+
+    def to_fen(self):
+        return FENConverter.to_fen(self.board, self.white_to_move, self.castling_fen(), self.en_passant_possible,
+                                   self.halfmove_clock, self.fullmove_number)
 
+    def to_epd(self, operations=None):
+        return FENConverter.to_epd(self.board, self.white_to_move, self.castling_fen(), self.en_passant_possible, operations)
+
+    def _find_king_positions(self):
+        white_king_pos, black_king_pos = (7,4), (0,4)
+        for r, row in enumerate(self.board):
+            for c, square in enumerate(row):
+                if square == 'wK':
+                    white_king_pos = (r,c)
+                elif square == 'bK':
+                    black_king_pos = (r,c)
+        return white_king_pos, black_king_pos
 
     def update_board(self, board):
         self.board = Board(board)
+        self._projection = None
 
     def get_projection_at_current_state(self):
+        """
+        A new Projection of the current position with its own copy of the history, for the AIs to search
+        """
         return Projection(self, self.board)
 
+    def _shared_projection(self):
+        """
+        The Projection make_move and undo_move push moves on and pop them off, so a move costs
+        the same however long the game is. Built on first use.
+        """
+        if self._projection is None:
+            self._projection = self.get_projection_at_current_state()
+            self._projection.projection_log = [move.move_id for move in self.move_log]
+        return self._projection
+
     def get_valid_moves(self):
-        return self.get_projection_at_current_state().get_valid_moves()
+        return self._shared_projection().get_valid_moves()
+
+    def parse_move(self, text):
+        """
+        Legal Move for a move in long algebraic notation, e.g. e2e4 or e7e8q.
+        Raises ValueError when there is no such legal move.
+        """
+        if len(text) < 4 or text[0] not in Move.filesToCols or text[2] not in Move.filesToCols \
+                or text[1] not in Move.ranksToRows or text[3] not in Move.ranksToRows:
+            raise ValueError(f"'{text}' is not a move in long algebraic notation")
+        start_sq = (Move.ranksToRows[text[1]], Move.filesToCols[text[0]])
+        end_sq = (Move.ranksToRows[text[3]], Move.filesToCols[text[2]])
+        for move in self.get_valid_moves():
+            if move.start_sq == start_sq and move.end_sq == end_sq:
+                promotion_piece = text[4].upper() if len(text) > 4 else 'Q'
+                if move.is_pawn_promotion and promotion_piece != move.promotion_piece:
+                    return Move(start_sq, end_sq, self.board, promotion_piece=promotion_piece)
+                return move
+        raise ValueError(f'{text} is not a legal move')
+
+    def san(self, move):
+        """
+        Standard algebraic notation of a legal move in the current position, e.g. Nf3 or exd8=Q+
+        """
+        return self._shared_projection().san(move)
+
+    def parse_san(self, text):
+        """
+        Legal Move for a move in standard algebraic notation, raises ValueError when there is none
+        """
+        return self._shared_projection().parse_san(text)
+
+    def is_draw(self):
+        """
+        Whether the game is drawn by stalemate, threefold repetition or the fifty-move rule
+        """
+        return self.stalemate or self.threefold_repetition or self.fifty_move_draw
 
 
     def make_move(self, move):
         # Make projection
-        projection = Projection(self, self.board)
-        projection.make_projection(move)
-        print(move.get_chess_notation())
+        projection = self._shared_projection()
+        projection.make_projection(move.move_id)
 
         # Logging forward
-        self.move_log.append(projection.projection_log[-1])
-        self.en_passant_log.append(projection.en_passant_log[-1])
-        self.castling_rights_log.append(projection.castling_rights_log[-1])
+        self.move_log.append(move)
 
         # Update other attributes and change turn
         self._update_attributes_from_projection(projection)
@@ -46,25 +165,36 @@ class GameState:
     def undo_move(self):
         if len(self.move_log) > 0:
             # Make projection
-            projection = Projection(self, self.board)
-            projection.projection_log = self.move_log
+            projection = self._shared_projection()
             projection.undo_projection()
 
             # Logging backward
-            self.move_log = projection.projection_log
-            self.en_passant_log = projection.en_passant_log
-            self.castling_rights_log = projection.castling_rights_log
+            self.move_log.pop()
 
             # Update other attributes and change turn
             self._update_attributes_from_projection(projection)
 
     def _update_attributes_from_projection(self, projection):
-        self.board = Board(projection.board)
+        projection.check_for_checkmate()
+        self.board = Board(projection.board.to_list())
         self.white_king_pos = projection.white_king_pos
         self.black_king_pos = projection.black_king_pos
         self.en_passant_possible = projection.en_passant_possible
+        self.en_passant_log = projection.en_passant_log
         self.curr_castling_rights = projection.curr_castling_rights
+        self.castling_log = projection.castling_log
+        self.captured_log = projection.captured_log
+        self.zobrist_key = projection.zobrist_key
+        self.zobrist_log = projection.zobrist_log
+        self.material = projection.material
+        self.psq_score = projection.psq_score
+        self.piece_count = projection.piece_count
+        self.halfmove_clock = projection.halfmove_clock
+        self.halfmove_log = projection.halfmove_log
+        self.fullmove_number = projection.fullmove_number
         self.in_check = projection.in_check
         self.checkmate = projection.checkmate
         self.stalemate = projection.stalemate
-        self.white_to_move = projection.white_to_move
\ No newline at end of file
+        self.threefold_repetition = projection.threefold_repetition
+        self.fifty_move_draw = projection.fifty_move_draw
+        self.white_to_move = projection.white_to_move
@@ -0,0 +1,139 @@
+"""
+Flat mailbox board and precomputed target tables, the backend of Projection.
+
+The position is one bytearray of 64 piece codes, squares numbered
+row * 8 + col like the bitboard engine (a8 is 0, h1 is 63). Every square has
+precomputed target lists: one ray per sliding direction plus the knight, king
+and pawn capture squares. The generators loop over those lists, so there is
+no per-step bounds check or string compare in the inner loops.
+
+MailboxBoard still answers board[r][c] with the '--', 'wP', ... strings, so
+the renderer, FEN and Move can read it like a Board.
+"""
+
+WHITE, BLACK = 0, 1
+EMPTY = 0
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(1, 7)
+BLACK_BIT = 8 # Piece code is kind | colour * BLACK_BIT, so code & 7 is the kind and code >> 3 the colour
+
+PIECE_CODES = {'--': EMPTY}
+for _colour, _letter in enumerate('wb'):
+    for _kind, _name in enumerate('PNBRQK', start=PAWN):
+        PIECE_CODES[_letter + _name] = _kind | _colour * BLACK_BIT
+PIECE_NAMES = ['--'] * 16
+for _name, _code in PIECE_CODES.items():
+    PIECE_NAMES[_code] = _name
+
+# Castling right bits
+WKS, WQS, BKS, BQS = 1, 2, 4, 8
+
+CASTLING_MASK = [WKS | WQS | BKS | BQS] * 64
+CASTLING_MASK[60] &= ~(WKS | WQS) # e1
+CASTLING_MASK[63] &= ~WKS # h1
+CASTLING_MASK[56] &= ~WQS # a1
+CASTLING_MASK[4] &= ~(BKS | BQS) # e8
+CASTLING_MASK[7] &= ~BKS # h8
+CASTLING_MASK[0] &= ~BQS # a8
+
+
+def _targets(sq, steps, repeat):
+    """
+    Squares reached from sq by each step, walking on until the edge when repeat is set
+    """
+    r, c = divmod(sq, 8)
+    lines = []
+    for d_r, d_c in steps:
+        line = []
+        t_r, t_c = r + d_r, c + d_c
+        while 0 <= t_r < 8 and 0 <= t_c < 8:
+            line.append(t_r * 8 + t_c)
+            if not repeat:
+                break
+            t_r, t_c = t_r + d_r, t_c + d_c
+        lines.append(tuple(line))
+    return lines
+
+
+ROOK_STEPS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+BISHOP_STEPS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+
+# Per square: rays running outwards in each direction, and flat target lists for the leapers
+ROOK_RAYS = [tuple(_targets(sq, ROOK_STEPS, True)) for sq in range(64)]
+BISHOP_RAYS = [tuple(_targets(sq, BISHOP_STEPS, True)) for sq in range(64)]
+QUEEN_RAYS = [ROOK_RAYS[sq] + BISHOP_RAYS[sq] for sq in range(64)]
+KNIGHT_TARGETS = [sum(_targets(sq, KNIGHT_STEPS, False), ()) for sq in range(64)]
+KING_TARGETS = [sum(_targets(sq, ROOK_STEPS + BISHOP_STEPS, False), ()) for sq in range(64)]
+# Squares a pawn of each colour on the square attacks
+PAWN_CAPTURES = [
+    [sum(_targets(sq, ((-1, -1), (-1, 1)), False), ()) for sq in range(64)],
+    [sum(_targets(sq, ((1, -1), (1, 1)), False), ()) for sq in range(64)],
+]
+SLIDER_RAYS = {BISHOP: BISHOP_RAYS, ROOK: ROOK_RAYS, QUEEN: QUEEN_RAYS}
+
+# Index into QUEEN_RAYS[a] of the ray from a that runs through b, at a * 64 + b, -1 when they share no line.
+# Rays 0-3 run along ranks and files, rays 4-7 along diagonals.
+RAY_TOWARDS = [-1] * (64 * 64)
+for _sq in range(64):
+    for _direction, _ray in enumerate(QUEEN_RAYS[_sq]):
+        for _target in _ray:
+            RAY_TOWARDS[_sq * 64 + _target] = _direction
+
+
+class _MailboxRow:
+    __slots__ = ('squares', 'offset')
+
+    def __init__(self, squares, offset):
+        self.squares = squares
+        self.offset = offset
+
+    def __getitem__(self, c):
+        return PIECE_NAMES[self.squares[self.offset + c]]
+
+    def __setitem__(self, c, piece):
+        self.squares[self.offset + c] = PIECE_CODES[piece]
+
+    def __len__(self):
+        return 8
+
+    def __iter__(self):
+        return (PIECE_NAMES[code] for code in self.squares[self.offset:self.offset + 8])
+
+
+class MailboxBoard:
+    """
+    A board kept as a bytearray of 64 piece codes.
+    board[r][c] reads and writes piece strings like a Board, for the renderer and Move.
+    """
+    __slots__ = ('squares',)
+
+    def __init__(self, board=None):
+        self.squares = bytearray(64)
+        if board is not None:
+            for r in range(8):
+                for c in range(8):
+                    self.squares[r * 8 + c] = PIECE_CODES[board[r][c]]
+
+    def __getitem__(self, r):
+        if not 0 <= r < 8:
+            raise IndexError('board row out of range')
+        return _MailboxRow(self.squares, r * 8)
+
+    def __len__(self):
+        return 8
+
+    def __iter__(self):
+        return (_MailboxRow(self.squares, r * 8) for r in range(8))
+
+    def __eq__(self, other):
+        if isinstance(other, MailboxBoard):
+            return self.squares == other.squares
+        if isinstance(other, list):
+            return self.to_list() == other
+        return NotImplemented
+
+    def to_list(self):
+        """
+        The position as an 8x8 list of strings, as used by Board
+        """
+        return [list(row) for row in self]
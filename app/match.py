@@ -0,0 +1,291 @@
+"""
+Headless self-play matches between two AIs across a process pool.
+
+Every opening is played twice, once with each engine as white, and the
+games are spread over worker processes. The result is reported from the
+first engine's side as win/draw/loss, an Elo difference with a 95% error
+bar and, when bounds are given, a sequential probability ratio test (SPRT)
+that stops the match as soon as it can decide between them.
+
+    python -m app.match search:depth=3 greedy --games 200 --openings openings.epd
+    python -m app.match search search:quiescence_depth=0 --movetime 100 --sprt 0 10
+
+An engine is written as name[:option=value,...], with name one of
+random, greedy or search. depth, movetime (ms) and nodes set the search
+limits, book the opening book file and tablebases the directory of
+endgame tables. Any other option is passed to the AI as a keyword argument.
+"""
+import argparse, math, random, threading, time
+from typing import NamedTuple
+
+from app.fen import FENConverter, START_FEN
+from app.game_state import GameState
+from app.chess_ai import RandomAI, GreedyAI, SearchAI
+from app.transposition_table import TranspositionTable
+from app.opening_book import OpeningBook
+from app.tablebase import Tablebase
+from app import worker_pool
+
+ENGINE_CLASSES = {'random': RandomAI, 'greedy': GreedyAI, 'search': SearchAI}
+TABLE_ENGINES = (GreedyAI, SearchAI) # Engines that take a transposition_table
+OPTION_NAMES = {'depth': 'max_depth', 'nodes': 'node_limit'}
+
+MAX_PLIES = 400 # Games still going after this many plies are scored as draws
+ELO_Z = 1.96 # 95% confidence
+
+
+class EngineConfig(NamedTuple):
+    name: str
+    ai_class: type
+    options: dict
+
+
+class MatchResult(NamedTuple):
+    wins: int
+    draws: int
+    losses: int
+    seconds: float
+    sprt: str # 'H1' (pass), 'H0' (fail), 'continue' or None without SPRT bounds
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+
+def parse_engine(spec, movetime=None, nodes=None, book=None, tablebases=None):
+    """
+    EngineConfig for name[:option=value,...]. movetime (ms) and nodes are per move
+    defaults for search engines, book the path of an opening book and tablebases the
+    directory of endgame tables for greedy and search engines. Options in the spec take precedence.
+    """
+    name, _, option_text = spec.partition(':')
+    if name not in ENGINE_CLASSES:
+        raise ValueError(f"unknown engine '{name}', expected one of {', '.join(ENGINE_CLASSES)}")
+    ai_class = ENGINE_CLASSES[name]
+
+    options = {}
+    if ai_class is SearchAI:
+        if movetime is not None:
+            options['time_limit'] = movetime / 1000
+        if nodes is not None:
+            options['node_limit'] = nodes
+        if movetime is not None or nodes is not None:
+            options['max_depth'] = 64 # Bounded by the per move limits instead
+    if book is not None and ai_class in TABLE_ENGINES:
+        options['opening_book'] = OpeningBook(book)
+    if tablebases is not None and ai_class in TABLE_ENGINES:
+        options['tablebase'] = Tablebase(tablebases)
+    for option in filter(None, option_text.split(',')):
+        key, _, value = option.partition('=')
+        if key == 'book':
+            options['opening_book'] = OpeningBook(value)
+            continue
+        if key == 'tablebases':
+            options['tablebase'] = Tablebase(value)
+            continue
+        value = float(value) if '.' in value else int(value)
+        if key == 'movetime':
+            options['time_limit'] = value / 1000
+        else:
+            options[OPTION_NAMES.get(key, key)] = value
+    return EngineConfig(spec, ai_class, options)
+
+
+def play_game(white, black, fen=START_FEN, max_plies=MAX_PLIES, transposition_tables=None):
+    """
+    Plays one game between two EngineConfigs from fen.
+    Returns (score for white: 1, 0.5 or 0, reason, plies played).
+    transposition_tables, if given, is a pair of tables for white and black, cleared first.
+    """
+    game_state = GameState.from_fen(fen)
+    engines = (white, black)
+    if transposition_tables is None:
+        transposition_tables = (TranspositionTable(), TranspositionTable())
+    for table in transposition_tables:
+        table.clear()
+
+    for plies in range(max_plies):
+        if game_state.checkmate:
+            return (0 if game_state.white_to_move else 1), 'checkmate', plies
+        if game_state.stalemate:
+            return 0.5, 'stalemate', plies
+        if game_state.threefold_repetition:
+            return 0.5, 'repetition', plies
+        if game_state.fifty_move_draw:
+            return 0.5, 'fifty moves', plies
+
+        side = 0 if game_state.white_to_move else 1
+        engine = engines[side]
+        if engine.ai_class in TABLE_ENGINES:
+            ai = engine.ai_class(game_state, transposition_table=transposition_tables[side], **engine.options)
+        else:
+            ai = engine.ai_class(game_state, **engine.options)
+        game_state.make_move(ai.find_move())
+    return 0.5, 'move limit', max_plies
+
+
+def _play_pair_game(index, first, second, fen, first_is_white, max_plies):
+    """
+    Worker task: plays one game and returns (index, score for first, reason, plies)
+    """
+    white, black = (first, second) if first_is_white else (second, first)
+    score, reason, plies = play_game(white, black, fen, max_plies, worker_pool.worker_tables) # One table per side
+    return index, score if first_is_white else 1 - score, reason, plies
+
+
+def read_openings(path):
+    """
+    Opening FENs from a FEN/EPD file, skipping blank and # lines
+    """
+    return [FENConverter.to_fen(*fields) for fields, _ in FENConverter.read_file(path)]
+
+
+def elo_difference(wins, draws, losses):
+    """
+    (Elo difference, 95% error margin) of the first engine over the second, from the mean game
+    score and its standard error. Infinite when one side scored every point.
+    """
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, math.inf
+    score, variance = _score_statistics(wins, draws, losses)
+    if variance == 0:
+        return _score_to_elo(score), math.inf
+    margin = ELO_Z * math.sqrt(variance / games)
+    return _score_to_elo(score), (_score_to_elo(score + margin) - _score_to_elo(score - margin)) / 2
+
+
+def _score_statistics(wins, draws, losses):
+    """
+    Mean and variance of the score of one game
+    """
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    return score, (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+
+
+def _score_to_elo(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1) + 0.0 # + 0.0 turns -0.0 into 0.0
+
+
+def _elo_to_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    """
+    Log-likelihood ratio of H1 (elo1) against H0 (elo0), with the normal approximation to the
+    trinomial game score distribution
+    """
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0
+    if wins == games or draws == games or losses == games:
+        # A run of one result has no variance yet, counting one more win and loss lets the test move.
+        # They count as games too, so the mean, variance and game count describe the same results.
+        wins += 1
+        losses += 1
+        games += 2
+    score, variance = _score_statistics(wins, draws, losses)
+    score0, score1 = _elo_to_score(elo0), _elo_to_score(elo1)
+    return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+
+def sprt_decision(wins, draws, losses, elo0, elo1, alpha=0.05, beta=0.05):
+    """
+    'H1' once the first engine is shown to be elo1 stronger, 'H0' once it is shown to be no more
+    than elo0 stronger, 'continue' until then
+    """
+    llr = sprt_llr(wins, draws, losses, elo0, elo1)
+    if llr >= math.log((1 - beta) / alpha):
+        return 'H1'
+    if llr <= math.log(beta / (1 - alpha)):
+        return 'H0'
+    return 'continue'
+
+
+def run_match(first, second, games, openings=None, workers=None, max_plies=MAX_PLIES, hash_mb=16,
+              sprt=None, progress=None):
+    """
+    Plays games between two EngineConfigs on a pool of workers and returns a MatchResult scored
+    from first's side. Openings are used in turn, each twice with the colours swapped.
+    sprt, if given, is (elo0, elo1, alpha, beta) and stops the match once the test decides.
+    progress, if given, is called with (index, score for first, reason, plies) after every game.
+    """
+    openings = openings or [START_FEN]
+    lock = threading.Lock()
+    counts = {1: 0, 0.5: 0, 0: 0}
+    decision = [None if sprt is None else 'continue']
+    start = time.perf_counter()
+
+    def game_done(result):
+        with lock:
+            counts[result[1]] += 1
+            if sprt is not None and decision[0] == 'continue':
+                decision[0] = sprt_decision(counts[1], counts[0.5], counts[0], *sprt)
+        if progress is not None:
+            progress(result)
+
+    tasks = ((index, first, second, openings[(index // 2) % len(openings)], index % 2 == 0, max_plies)
+             for index in range(games))
+    # Two queued games per worker, so few are left to finish once the SPRT decides
+    worker_pool.run_tasks(_play_pair_game, tasks, workers, worker_pool.init_tables, (hash_mb, 2), game_done,
+                          should_stop=lambda: decision[0] in ('H0', 'H1'), pending_per_worker=2)
+    return MatchResult(counts[1], counts[0.5], counts[0], time.perf_counter() - start, decision[0])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play a headless match between two AIs on a pool of workers')
+    parser.add_argument('first', help='engine scored in the results, e.g. search:depth=3')
+    parser.add_argument('second', help='opponent, e.g. greedy')
+    parser.add_argument('--games', type=int, default=100, help='games to play, at most')
+    parser.add_argument('--openings', default=None, help='FEN or EPD file of starting positions, defaults to the initial position')
+    parser.add_argument('--shuffle', action='store_true', help='play the openings in random order')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, defaults to the CPU count')
+    parser.add_argument('--movetime', type=int, default=None, help='milliseconds per move for search engines')
+    parser.add_argument('--nodes', type=int, default=None, help='nodes per move for search engines')
+    parser.add_argument('--book', default=None, help='opening book file both engines play from while in book')
+    parser.add_argument('--tablebases', default=None, help='directory of endgame tables both engines probe')
+    parser.add_argument('--max-plies', type=int, default=MAX_PLIES, help='plies after which a game is scored as a draw')
+    parser.add_argument('--hash', type=int, default=16, help='transposition table size per side per worker in MB')
+    parser.add_argument('--sprt', type=float, nargs=2, metavar=('ELO0', 'ELO1'), default=None,
+                        help='run an SPRT of ELO0 against ELO1 and stop once it decides')
+    parser.add_argument('--alpha', type=float, default=0.05, help='SPRT false positive rate')
+    parser.add_argument('--beta', type=float, default=0.05, help='SPRT false negative rate')
+    args = parser.parse_args(argv)
+
+    try:
+        first = parse_engine(args.first, args.movetime, args.nodes, args.book, args.tablebases)
+        second = parse_engine(args.second, args.movetime, args.nodes, args.book, args.tablebases)
+    except ValueError as error:
+        parser.error(str(error))
+    openings = read_openings(args.openings) if args.openings else None
+    if openings and args.shuffle:
+        random.shuffle(openings)
+    sprt = (args.sprt[0], args.sprt[1], args.alpha, args.beta) if args.sprt else None
+
+    def progress(result):
+        index, score, reason, plies = result
+        print(f'game {index + 1:4d}  {first.name if score == 1 else second.name if score == 0 else "draw"}'
+              f'  {reason}  {plies} plies', flush=True)
+
+    result = run_match(first, second, args.games, openings, args.workers, args.max_plies, args.hash, sprt, progress)
+    elo, margin = elo_difference(result.wins, result.draws, result.losses)
+    print(f'{first.name} vs {second.name}')
+    print(f'games {result.games}  wins {result.wins}  draws {result.draws}  losses {result.losses}')
+    print(f'elo {elo:+.1f} +/- {margin:.1f}')
+    if sprt is not None:
+        llr = sprt_llr(result.wins, result.draws, result.losses, sprt[0], sprt[1])
+        bounds = (math.log(sprt[3] / (1 - sprt[2])), math.log((1 - sprt[3]) / sprt[2]))
+        verdict = {'H1': 'pass', 'H0': 'fail', 'continue': 'inconclusive'}[result.sprt]
+        print(f'sprt [{sprt[0]:g}, {sprt[1]:g}]  llr {llr:.2f} ({bounds[0]:.2f}, {bounds[1]:.2f})  {verdict}')
+    print(f'time {result.seconds:.2f}s  {result.games / result.seconds if result.seconds > 0 else 0:.2f} games/s')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,31 @@
+"""
+16-bit move codes, shared by Move and the bitboard generator.
+
+Squares are numbered row * 8 + col (a8 is 0, h1 is 63). Bits 0-5 hold the
+start square, bits 6-11 the end square and bits 12-15 the move flag, so a
+move fits in an array('H') slot and compares as a plain int. Code 0 (a8 to
+a8) is never a legal move, so it can stand for no move.
+"""
+
+# Move flags
+QUIET = 0
+DOUBLE_PAWN_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4
+EN_PASSANT = 5
+PROMOTION = 8 # promotion piece is PROMOTION_LETTERS[flag & 3], CAPTURE bit may be set too
+
+PROMOTION_LETTERS = 'NBRQ'
+
+
+def move_start(code):
+    return code & 63
+
+
+def move_end(code):
+    return (code >> 6) & 63
+
+
+def move_flag(code):
+    return code >> 12
@@ -0,0 +1,123 @@
+"""
+Move ordering for the search.
+
+Moves are tried in this order: the transposition table move, captures by
+most valuable victim / least valuable attacker (MVV-LVA), promotions, the
+killer moves of the ply, quiet moves by their history score, then captures
+that static exchange evaluation says lose material.
+
+Moves are the 16-bit codes from app.move_encoding. The moved and captured
+pieces are read from the projection's squares, and their mailbox kinds
+(PAWN 1 up to KING 6) double as the MVV-LVA ranks.
+"""
+from app.mailbox import PAWN
+from app.move_encoding import CAPTURE, EN_PASSANT, PROMOTION
+
+TT_MOVE_SCORE = 1_000_000
+CAPTURE_SCORE = 100_000
+PROMOTION_SCORE = 90_000
+KILLER_SCORE = 80_000
+LOSING_CAPTURE_SCORE = -CAPTURE_SCORE
+HISTORY_LIMIT = 60_000 # History scores are halved once any reaches this, so they stay below the killers
+
+KILLERS_PER_PLY = 2
+FROM_TO_MASK = 0xFFF # Start and end square bits of a code, the history index
+
+
+class MoveOrderer:
+    """
+    Killer slots per ply and a history table, plus counters of how often the
+    first move searched was the one that caused a beta cutoff.
+    squares is the bytearray of the Projection being searched.
+    """
+    def __init__(self, squares, max_ply=128, static_exchange=None):
+        self.squares = squares
+        self.max_ply = max_ply
+        self.static_exchange = static_exchange # Projection.static_exchange, used to find losing captures
+        self.killers = [[None] * KILLERS_PER_PLY for _ in range(max_ply)]
+        self.history = [0] * (64 * 64)
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.cutoff_index_total = 0
+
+    def new_search(self):
+        """
+        Clears the killers and ages the history so older searches count for less
+        """
+        self.killers = [[None] * KILLERS_PER_PLY for _ in range(self.max_ply)]
+        self.history = [score >> 1 for score in self.history]
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.cutoff_index_total = 0
+
+    def mvv_lva(self, code):
+        squares = self.squares
+        victim = PAWN if code >> 12 == EN_PASSANT else squares[(code >> 6) & 63] & 7
+        return victim * 10 - (squares[code & 63] & 7)
+
+    def score_move(self, code, ply, tt_move):
+        if code == tt_move:
+            return TT_MOVE_SCORE
+        flag = code >> 12
+        if flag & CAPTURE:
+            squares = self.squares
+            moved = squares[code & 63] & 7
+            victim = PAWN if flag == EN_PASSANT else squares[(code >> 6) & 63] & 7
+            # Only a capture by a more valuable piece can lose material, SEE is skipped for the rest
+            if self.static_exchange is not None and moved > victim and self.static_exchange(code) < 0:
+                return LOSING_CAPTURE_SCORE + victim * 10 - moved
+            return CAPTURE_SCORE + victim * 10 - moved
+        if flag & PROMOTION:
+            return PROMOTION_SCORE
+        if ply < self.max_ply:
+            killers = self.killers[ply]
+            for slot in range(KILLERS_PER_PLY):
+                if killers[slot] == code:
+                    return KILLER_SCORE - slot
+        return self.history[code & FROM_TO_MASK]
+
+    def order_captures(self, moves):
+        """
+        Captures and promotions sorted for quiescence search, by MVV-LVA with promotions first
+        """
+        return sorted(moves, key=lambda code: (PROMOTION_SCORE if code >> 12 & PROMOTION else 0)
+                      + (self.mvv_lva(code) if code >> 12 & CAPTURE else 0), reverse=True)
+
+    def order(self, moves, ply, tt_move):
+        """
+        Moves sorted best candidates first, as a new list
+        """
+        return sorted(moves, key=lambda code: self.score_move(code, ply, tt_move), reverse=True)
+
+    def record_cutoff(self, code, ply, depth, move_index):
+        """
+        Called when the move with code caused a beta cutoff after move_index earlier moves were searched
+        """
+        self.cutoffs += 1
+        self.cutoff_index_total += move_index
+        if move_index == 0:
+            self.first_move_cutoffs += 1
+
+        if code >> 12 & (CAPTURE | PROMOTION):
+            return # Captures are already ordered by MVV-LVA
+        if ply < self.max_ply:
+            killers = self.killers[ply]
+            if killers[0] != code:
+                killers[1:] = killers[:-1]
+                killers[0] = code
+        index = code & FROM_TO_MASK
+        self.history[index] += depth * depth
+        if self.history[index] >= HISTORY_LIMIT:
+            self.history = [score >> 1 for score in self.history]
+
+    def stats(self):
+        """
+        Ordering quality: the share of cutoffs made by the first move searched
+        and the average number of moves searched before a cutoff
+        """
+        return {
+            'cutoffs': self.cutoffs,
+            'first_move_cutoffs': self.first_move_cutoffs,
+            'first_move_cutoff_rate': self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0,
+            'average_cutoff_index': self.cutoff_index_total / self.cutoffs if self.cutoffs else 0.0,
+        }
@@ -0,0 +1,211 @@
+"""
+Opening book stored as a sorted binary file and probed through mmap.
+
+The file is an 8-byte header followed by fixed-size entries of
+(Zobrist key, 16-bit move code, weight), sorted by key and then move. A
+probe binary searches the mapped file for the key of the position and reads
+the run of entries that follow, so nothing is loaded into Python objects up
+front and every process that opens the book shares one page-cached copy.
+
+Books are built from PGN game archives, from lines of moves in long
+algebraic notation played from the initial position, e.g. 'e2e4 e7e5 g1f3',
+or from FEN/EPD lines whose bm operation names the book moves of that
+position:
+
+    python -m app.opening_book build games.pgn book.bin --plies 16
+    python -m app.opening_book probe book.bin --fen "<fen>"
+"""
+import argparse, mmap, random, struct
+
+from app.fen import FENConverter, START_FEN
+from app.game_state import GameState
+from app.pgn import read_games
+
+MAGIC = b'DLBOOK1\n'
+ENTRY = struct.Struct('<QHH') # key, move code, weight
+KEY = struct.Struct('<Q')
+MAX_WEIGHT = 0xFFFF
+
+DEFAULT_PLIES = 20 # Moves deeper into a line than this are left out of the book
+
+
+def write_book(path, weights):
+    """
+    Writes a book file from {(key, move code): weight}. Weights above MAX_WEIGHT are capped.
+    """
+    with open(path, 'wb') as file:
+        file.write(MAGIC)
+        for (key, code), weight in sorted(weights.items()):
+            file.write(ENTRY.pack(key, code, min(weight, MAX_WEIGHT)))
+
+
+def add_game(weights, game, max_plies=DEFAULT_PLIES):
+    """
+    Adds one to the weight of every move of a PGNGame up to max_plies. Stops at the first illegal move.
+    """
+    try:
+        for game_state, move in game.iter_moves(max_plies):
+            entry = (game_state.zobrist_key, move.move_id)
+            weights[entry] = weights.get(entry, 0) + 1
+    except ValueError:
+        return
+
+
+def add_line(weights, moves, fen=START_FEN, max_plies=DEFAULT_PLIES):
+    """
+    Adds one to the weight of every move of a line of long algebraic moves played from fen,
+    up to max_plies. Stops at the first illegal move.
+    """
+    game_state = GameState.from_fen(fen)
+    for text in moves[:max_plies]:
+        try:
+            move = game_state.parse_move(text)
+        except ValueError:
+            return
+        entry = (game_state.zobrist_key, move.move_id)
+        weights[entry] = weights.get(entry, 0) + 1
+        game_state.make_move(move)
+
+
+def add_position(weights, fields, best_moves):
+    """
+    Adds one to the weight of each long algebraic move in best_moves for the position of FENFields
+    """
+    game_state = GameState.from_fen_fields(fields)
+    for text in best_moves:
+        try:
+            move = game_state.parse_move(text)
+        except ValueError:
+            continue
+        entry = (game_state.zobrist_key, move.move_id)
+        weights[entry] = weights.get(entry, 0) + 1
+
+
+def build_book(input_path, output_path, max_plies=DEFAULT_PLIES):
+    """
+    Builds a book file from a PGN file, or a file of move lines and FEN/EPD lines.
+    Returns the number of entries.
+    """
+    weights = {}
+    if input_path.lower().endswith('.pgn'):
+        for game in read_games(input_path):
+            add_game(weights, game, max_plies)
+        write_book(output_path, weights)
+        return len(weights)
+    with open(input_path, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if '/' in line.split(None, 1)[0]:
+                fields, operations = FENConverter.parse_line(line)
+                add_position(weights, fields, operations.get('bm', '').split())
+            else:
+                add_line(weights, line.split(), max_plies=max_plies)
+    write_book(output_path, weights)
+    return len(weights)
+
+
+class OpeningBook:
+    """
+    Read-only view of a book file. moves(key) lists the (move code, weight) pairs of a position,
+    choose_move(game_state) picks a legal book move at random in proportion to its weight.
+    Pickling keeps only the path, so a book can be passed to worker processes, which map it again.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f'{path} is not an opening book')
+        self.size = (len(self.map) - len(MAGIC)) // ENTRY.size
+
+    def __len__(self):
+        return self.size
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def _key_at(self, index):
+        return KEY.unpack_from(self.map, len(MAGIC) + index * ENTRY.size)[0]
+
+    def moves(self, key):
+        """
+        (move code, weight) for every book move of the position with Zobrist key
+        """
+        lo, hi = 0, self.size
+        while lo < hi: # First entry with a key not below key
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        found = []
+        offset = len(MAGIC) + lo * ENTRY.size
+        while lo < self.size:
+            entry_key, code, weight = ENTRY.unpack_from(self.map, offset)
+            if entry_key != key:
+                break
+            found.append((code, weight))
+            lo += 1
+            offset += ENTRY.size
+        return found
+
+    def probe(self, game_state):
+        """
+        (Move, weight) for the book moves of game_state that are legal there
+        """
+        book_moves = self.moves(game_state.zobrist_key)
+        if not book_moves:
+            return []
+        legal = {move.move_id: move for move in game_state.get_valid_moves()}
+        return [(legal[code], weight) for code, weight in book_moves if code in legal]
+
+    def choose_move(self, game_state, rng=random):
+        """
+        A book move for game_state picked in proportion to its weight, or None when out of book
+        """
+        book_moves = self.probe(game_state)
+        if not book_moves:
+            return None
+        return rng.choices([move for move, _ in book_moves], weights=[weight for _, weight in book_moves])[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build or probe an opening book')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='build a book from a PGN file, or from move lines and FEN/EPD lines with bm operations')
+    build.add_argument('input')
+    build.add_argument('output')
+    build.add_argument('--plies', type=int, default=DEFAULT_PLIES, help='plies of each line kept in the book')
+    probe = commands.add_parser('probe', help='list the book moves of a position')
+    probe.add_argument('book')
+    probe.add_argument('--fen', default=START_FEN)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        entries = build_book(args.input, args.output, args.plies)
+        print(f'{entries} entries written to {args.output}')
+    else:
+        with OpeningBook(args.book) as book:
+            for move, weight in book.probe(GameState.from_fen(args.fen)):
+                print(f'{move.get_chess_notation()} {weight}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,128 @@
+"""
+Perft: counts the leaf nodes of the legal move tree to a fixed depth.
+
+Comparing the counts with known reference values is the standard way to
+check move generation, and timing them gives a nodes/sec figure for the
+move generator. --engine bitboard counts with BitboardEngine instead, as a
+cross-check on Projection's generator.
+
+    python -m app.perft --suite
+    python -m app.perft --fen "<fen>" --depth 3 --divide
+    python -m app.perft --suite --engine bitboard
+"""
+import argparse, time
+
+from app.fen import castling_board
+from app.game_state import GameState
+from app.bitboard_engine import BitboardEngine
+from app.projection_engine import Move
+
+# (name, FEN, leaf counts for depth 1, 2, 3, ...)
+REFERENCE_POSITIONS = [
+    ('start', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1', [20, 400, 8902, 197281, 4865609]),
+    ('castling', castling_board + ' w KQkq - 0 1', [33, 1052, 33949, 1091713]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1', [48, 2039, 97862, 4085603]),
+    ('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', [14, 191, 2812, 43238, 674624]),
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', [6, 264, 9467, 422333]),
+    ('position5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', [44, 1486, 62379, 2103487]),
+    ('position6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10', [46, 2079, 89890, 3894594]),
+]
+
+ENGINES = ('projection', 'bitboard')
+
+
+def position_from_fen(fen, engine='projection'):
+    """
+    Position to run perft on, generating underpromotions so the counts match the references
+    """
+    game_state = GameState.from_fen(fen)
+    if engine == 'bitboard':
+        return BitboardEngine.from_game_state(game_state, underpromotions=True)
+    projection = game_state.get_projection_at_current_state()
+    projection.underpromotions = True
+    return projection
+
+
+def perft(position, depth):
+    """
+    Number of leaf nodes depth plies below position.
+    The last ply is counted from the move list without making the moves.
+    """
+    moves = position.generate_legal_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for code in moves:
+        position.make_projection(code)
+        nodes += perft(position, depth - 1)
+        position.undo_projection()
+    return nodes
+
+
+def divide(position, depth):
+    """
+    Leaf count below each root move, as a list of (move notation, nodes)
+    """
+    counts = []
+    for code in position.generate_legal_moves():
+        notation = Move.from_code(code, position.board).get_chess_notation()
+        position.make_projection(code)
+        counts.append((notation, perft(position, depth - 1)))
+        position.undo_projection()
+    return counts
+
+
+def run_perft(fen, depth, engine='projection', show_divide=False):
+    """
+    Runs perft on fen, printing the divide when asked, and returns (nodes, seconds)
+    """
+    position = position_from_fen(fen, engine)
+    start = time.perf_counter()
+    if show_divide:
+        counts = divide(position, depth)
+        for notation, nodes in counts:
+            print(f'{notation}: {nodes}')
+        nodes = sum(nodes for _, nodes in counts)
+    else:
+        nodes = perft(position, depth)
+    return nodes, time.perf_counter() - start
+
+
+def _nps(nodes, seconds):
+    return int(nodes / seconds) if seconds > 0 else 0
+
+
+def run_suite(max_depth, engine='projection'):
+    """
+    Checks every reference position up to max_depth, returns True if all counts match
+    """
+    all_passed = True
+    for name, fen, expected_counts in REFERENCE_POSITIONS:
+        for depth, expected in enumerate(expected_counts[:max_depth], start=1):
+            nodes, seconds = run_perft(fen, depth, engine)
+            passed = nodes == expected
+            all_passed = all_passed and passed
+            print(f"{name:<10} depth {depth}  nodes {nodes:>9}  expected {expected:>9}  "
+                  f"{'PASS' if passed else 'FAIL'}  {seconds:7.2f}s  {_nps(nodes, seconds):>8} nps")
+    return all_passed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Count move generation leaf nodes to a fixed depth')
+    parser.add_argument('--fen', default=REFERENCE_POSITIONS[0][1], help='position to search, defaults to the start position')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--divide', action='store_true', help='print the node count below each root move')
+    parser.add_argument('--suite', action='store_true', help='check the reference positions up to --depth')
+    parser.add_argument('--engine', choices=ENGINES, default='projection')
+    args = parser.parse_args(argv)
+
+    if args.suite:
+        return 0 if run_suite(args.depth, args.engine) else 1
+
+    nodes, seconds = run_perft(args.fen, args.depth, args.engine, args.divide)
+    print(f'nodes {nodes}  time {seconds:.2f}s  {_nps(nodes, seconds)} nps')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
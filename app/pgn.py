@@ -0,0 +1,208 @@
+"""
+PGN (Portable Game Notation) export and a streaming reader.
+
+game_to_pgn writes the move_log of a GameState as a PGN game in standard
+algebraic notation. read_games goes through a PGN file one line at a time
+and yields one PGNGame at a time, so only the game being read is held in
+memory however large the archive is. Comments, variations and numeric
+annotation glyphs are skipped.
+
+    python -m app.pgn games.pgn --replay
+"""
+import argparse, re, time
+from typing import NamedTuple
+
+from app.fen import FENConverter, START_FEN
+from app.game_state import GameState
+from app.projection_engine import Projection
+
+SEVEN_TAG_ROSTER = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+LINE_LENGTH = 79
+
+TAG_PATTERN = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# Movetext tokens: comments, variations, glyphs, move numbers, results, then moves
+TOKEN_PATTERN = re.compile(r'\{[^}]*\}?|;.*|\(|\)|\$\d+|\d+\.+|1-0|0-1|1/2-1/2|\*|[^\s{}();$]+')
+
+
+class PGNGame(NamedTuple):
+    headers: dict
+    moves: list # SAN strings, main line only
+    result: str
+
+    def iter_moves(self, max_plies=None):
+        """
+        Yields (GameState, Move) before each move of the game is made on the GameState, which is
+        the same object throughout. Starts from the FEN header when there is one.
+        Raises ValueError at the first move that is not legal.
+        """
+        game_state = GameState.from_fen(self.headers.get('FEN', START_FEN))
+        for san in self.moves[:max_plies]:
+            move = game_state.parse_san(san)
+            yield game_state, move
+            game_state.make_move(move)
+
+    def replay(self):
+        """
+        GameState at the end of the game
+        """
+        game_state = GameState.from_fen(self.headers.get('FEN', START_FEN))
+        for san in self.moves:
+            game_state.make_move(game_state.parse_san(san))
+        return game_state
+
+
+def game_result(game_state):
+    if game_state.checkmate:
+        return '0-1' if game_state.white_to_move else '1-0'
+    if game_state.is_draw():
+        return '1/2-1/2'
+    return '*'
+
+
+def _unwound_projection(game_state):
+    """
+    Projection of the position before the first move of game_state.move_log, on a copy of the board
+    """
+    projection = Projection(game_state, [list(row) for row in game_state.board])
+    projection.projection_log = [move.move_id for move in game_state.move_log]
+    while projection.projection_log:
+        projection.undo_projection()
+    return projection
+
+
+def game_to_pgn(game_state, headers=None):
+    """
+    PGN text of the moves in game_state.move_log. headers add to or override the Seven Tag Roster,
+    Result defaults to the outcome of the game and a FEN header is added when it did not start
+    from the initial position.
+    """
+    projection = _unwound_projection(game_state)
+    start_fen = FENConverter.to_fen(projection.board, projection.white_to_move, projection.curr_castling_rights.to_fen(),
+                                    projection.en_passant_possible, projection.halfmove_clock, projection.fullmove_number)
+
+    tags = dict.fromkeys(SEVEN_TAG_ROSTER, '?')
+    tags['Date'] = '????.??.??'
+    tags['Result'] = game_result(game_state)
+    if start_fen != START_FEN:
+        tags['SetUp'] = '1'
+        tags['FEN'] = start_fen
+    tags.update(headers or {})
+
+    tokens = []
+    for i, move in enumerate(game_state.move_log):
+        if projection.white_to_move:
+            tokens.append(f'{projection.fullmove_number}.')
+        elif i == 0:
+            tokens.append(f'{projection.fullmove_number}...')
+        tokens.append(projection.san(move))
+        projection.make_projection(move.move_id)
+    tokens.append(tags['Result'])
+
+    lines = [f'[{name} "{_escape_tag(value)}"]' for name, value in tags.items()]
+    lines.append('')
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = f'{line} {token}' if line else token
+    lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+def _escape_tag(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def write_game(file, game_state, headers=None):
+    """
+    Appends the PGN of game_state to an open text file, followed by a blank line
+    """
+    file.write(game_to_pgn(game_state, headers) + '\n')
+
+
+def parse_games(lines):
+    """
+    Yields a PGNGame for every game in an iterable of PGN lines
+    """
+    headers = {}
+    moves = []
+    variation_depth = 0
+    in_comment = False
+
+    for line in lines:
+        if in_comment: # Inside a { comment } that started on an earlier line
+            end = line.find('}')
+            if end < 0:
+                continue
+            line = line[end + 1:]
+            in_comment = False
+        line = line.strip()
+        if not line or line.startswith('%'):
+            continue
+
+        tag = TAG_PATTERN.match(line) if line.startswith('[') and variation_depth == 0 else None
+        if tag is not None:
+            if moves: # A game without a result token ends at the next game's tags
+                yield PGNGame(headers, moves, headers.get('Result', '*'))
+                headers, moves = {}, []
+            headers[tag.group(1)] = tag.group(2).replace('\\"', '"').replace('\\\\', '\\')
+            continue
+
+        for token in TOKEN_PATTERN.findall(line):
+            first = token[0]
+            if first == '{':
+                in_comment = not token.endswith('}')
+            elif first == ';' or first == '$':
+                continue
+            elif first == '(':
+                variation_depth += 1
+            elif first == ')':
+                variation_depth = max(variation_depth - 1, 0)
+            elif variation_depth > 0 or first.isdigit() and token.endswith('.'):
+                continue
+            elif token in RESULTS:
+                yield PGNGame(headers, moves, token)
+                headers, moves = {}, []
+            else:
+                moves.append(token)
+
+    if headers or moves:
+        yield PGNGame(headers, moves, headers.get('Result', '*'))
+
+
+def read_games(path):
+    """
+    Yields a PGNGame for every game of a PGN file, reading it a line at a time
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace') as file:
+        yield from parse_games(file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Read every game of a PGN file')
+    parser.add_argument('pgn')
+    parser.add_argument('--replay', action='store_true', help='play the moves out to check that they are legal')
+    args = parser.parse_args(argv)
+
+    games = plies = errors = 0
+    start = time.perf_counter()
+    for game in read_games(args.pgn):
+        games += 1
+        plies += len(game.moves)
+        if args.replay:
+            try:
+                game.replay()
+            except ValueError as error:
+                errors += 1
+                print(f'game {games}: {error}')
+    seconds = time.perf_counter() - start
+    print(f'games {games}  plies {plies}' + (f'  illegal {errors}' if args.replay else '') +
+          f'  time {seconds:.2f}s  {games / seconds if seconds > 0 else 0:.1f} games/s')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,448 +1,724 @@
+import re
+from array import array
+from bisect import insort
+
 from app.board import Board
-from app.config import GAME_CONFIG
-import copy
+from app import zobrist
+from app import evaluation
+from app.mailbox import (MailboxBoard, WHITE, BLACK, EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, BLACK_BIT,
+                         WKS, WQS, BKS, BQS, CASTLING_MASK, ROOK_RAYS, BISHOP_RAYS, QUEEN_RAYS, SLIDER_RAYS, KNIGHT_TARGETS, KING_TARGETS,
+                         PAWN_CAPTURES, RAY_TOWARDS)
+from app.move_encoding import (QUIET, DOUBLE_PAWN_PUSH, KING_CASTLE, QUEEN_CASTLE, CAPTURE, EN_PASSANT,
+                               PROMOTION, PROMOTION_LETTERS, move_start, move_end, move_flag)
+
+# Piece values for static exchange, the king sorts after every other attacker
+EXCHANGE_VALUES = dict(evaluation.PIECE_VALUES, K=20000)
+EXCHANGE_BY_KIND = [0] + [EXCHANGE_VALUES[kind] for kind in 'PNBRQK'] # Indexed by mailbox piece kind
 
-from icecream import ic
+# Standard algebraic notation: piece, from file, from rank, capture, destination, promotion
+SAN_PATTERN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=?([NBRQ]))?$')
 
 class Projection(Board):
+    """
+    The position the AIs search and GameState makes its moves on.
+
+    Pieces are kept in squares, a flat bytearray of mailbox piece codes (see app.mailbox),
+    and the generators walk its precomputed ray and target tables. board is a view of the
+    same bytearray that still reads board[r][c] as piece strings, for the renderer, FEN and Move.
+    """
+    underpromotions = False # Promote to queen only, set to also generate rook, bishop and knight promotions
+
     def __init__(self, game_state, board):
-        super().__init__(board)
+        self.board = MailboxBoard(board) # A copy, so projecting moves never touches the GameState
+        self.squares = self.board.squares
+        self._fen = None
+        self._fen_key = None
         self.game_state = game_state
-        self.move_functions = {
-            'P': self.get_pawn_moves,
-            'R': self.get_rook_moves,
-            'N': self.get_knight_moves,
-            'B': self.get_bishop_moves,
-            'Q': self.get_queen_moves,
-            'K': self.get_king_moves
-        }
         self.projection_log = []
 
+        # Own copies of the game state
+        self.white_to_move = game_state.white_to_move
+        self.king_squares = [r * 8 + c for r, c in (game_state.white_king_pos, game_state.black_king_pos)]
+        self.en_passant_possible = game_state.en_passant_possible
+        self.en_passant_log = list(game_state.en_passant_log)
+        self.castling = game_state.curr_castling_rights.to_bits()
+        self.castling_log = list(game_state.castling_log)
+        self.captured_log = list(game_state.captured_log)
+        self.in_check = game_state.in_check
+        self.checkmate = game_state.checkmate
+        self.stalemate = game_state.stalemate
+        self.threefold_repetition = game_state.threefold_repetition
+        self.fifty_move_draw = game_state.fifty_move_draw
+        self.zobrist_key = game_state.zobrist_key
+        self.zobrist_log = list(game_state.zobrist_log)
+        self.material = game_state.material
+        self.psq_score = game_state.psq_score
+        self.piece_count = game_state.piece_count
+        self.halfmove_clock = game_state.halfmove_clock
+        self.halfmove_log = list(game_state.halfmove_log)
+        self.fullmove_number = game_state.fullmove_number
+        self.status_log = [{}] # Cached status queries, one dict per projected position
+
     def __getattr__(self, attr):
         # Delegating attribute access to the GameState instance
         if hasattr(self.game_state, attr):
             return getattr(self.game_state, attr)
         else:
             raise AttributeError(f"'Projection' object has no attribute '{attr}'")
-    
-    def make_projection(self, move):
-        """
-        Use Move object to project a move
-        """
-        self.board[move.start_row][move.start_col] = '--'
-        self.board[move.end_row][move.end_col] = move.piece_moved
-        
-        if move.piece_moved == 'wK':
-            self.white_king_pos = move.end_sq
-        elif move.piece_moved == 'bK':
-            self.black_king_pos = move.end_sq
-        # print(move.get_chess_notation())
-        
-        # Checks if move pushes pawns to promotion
-        if move.is_pawn_promotion:
-            self.board[move.end_row][move.end_col] = move.piece_moved[0] + 'Q' # to do this choice on main.py to avoid changing the Move class
-        
-        # Removes enemy pawn behind en passant
-        if move.is_en_passant:
-            self.board[move.start_row][move.end_col] = '--'
-        
-        # Generates en passant posibilities
-        if move.piece_moved[1] == 'P' and abs(move.start_row - move.end_row) == 2:
-            self.en_passant_possible = ((move.start_row + move.end_row) // 2, move.start_col)
-        else:
-            self.en_passant_possible = ()
-
-        self.en_passant_log.append(self.en_passant_possible)
 
+    @property
+    def white_king_pos(self):
+        return divmod(self.king_squares[WHITE], 8)
 
-        # Castling move
-        if move.is_castling:
-            if move.end_col - move.start_col > 0: # kingside castle move
-                self.board[move.end_row][move.end_col-1] = self.board[move.end_row][move.end_col+1]
-                self.board[move.end_row][move.end_col+1] = '--'
-            else: # queenside
-                self.board[move.end_row][move.end_col+1] = self.board[move.end_row][move.end_col-2]
-                self.board[move.end_row][move.end_col-2] = '--'
-        
-        # Update Castling Rights
-        self.update_castling_rights(move)
+    @property
+    def black_king_pos(self):
+        return divmod(self.king_squares[BLACK], 8)
 
-        # Append to logs
-        self.castling_rights_log.append(CastlingRights(self.curr_castling_rights.wks, self.curr_castling_rights.wqs,
-                                        self.curr_castling_rights.bks, self.curr_castling_rights.bqs))
-        self.projection_log.append(move)
+    @property
+    def curr_castling_rights(self):
+        return CastlingRights.from_bits(self.castling)
 
-        # Change to other team before checking for checks
+    def _en_passant_key(self):
+        """
+        Zobrist key of the en passant square, only counted when a pawn of the side to move can capture there
+        """
+        if not self.en_passant_possible:
+            return 0
+        r, c = self.en_passant_possible
+        us = WHITE if self.white_to_move else BLACK
+        pawn = PAWN | us * BLACK_BIT
+        for sq in PAWN_CAPTURES[us ^ 1][r * 8 + c]: # Where a pawn of ours attacking the square would stand
+            if self.squares[sq] == pawn:
+                return zobrist.EN_PASSANT_KEYS[c]
+        return 0
+
+    def make_projection(self, code):
+        """
+        Project a move given as its 16-bit code, Move.move_id for a Move object.
+        Only the position is updated, use is_check/has_legal_move/is_checkmate for its status.
+        """
+        squares = self.squares
+        keys = zobrist.PIECE_KEYS_BY_CODE
+        start = code & 63
+        end = (code >> 6) & 63
+        flag = code >> 12
+        piece = squares[start]
+
+        # Take out what is about to change from the Zobrist key
+        key = self.zobrist_key ^ zobrist.CASTLING_KEYS[self.castling] ^ self._en_passant_key() ^ zobrist.BLACK_TO_MOVE_KEY
+
+        if flag == EN_PASSANT: # The captured pawn is beside the start square, not on the end square
+            captured_sq = (start & 56) | (end & 7)
+            captured = squares[captured_sq]
+            squares[captured_sq] = EMPTY
+        else:
+            captured_sq = end
+            captured = squares[end]
+        placed = (KNIGHT + (flag & 3)) | (piece & BLACK_BIT) if flag & PROMOTION else piece
+        squares[start] = EMPTY
+        squares[end] = placed
+        key ^= keys[piece][start] ^ keys[placed][end] ^ keys[captured][captured_sq]
+
+        if piece & 7 == KING:
+            self.king_squares[piece >> 3] = end
+            if flag == KING_CASTLE:
+                rook = squares[start + 3]
+                squares[start + 1] = rook
+                squares[start + 3] = EMPTY
+                key ^= keys[rook][start + 3] ^ keys[rook][start + 1]
+            elif flag == QUEEN_CASTLE:
+                rook = squares[start - 4]
+                squares[start - 1] = rook
+                squares[start - 4] = EMPTY
+                key ^= keys[rook][start - 4] ^ keys[rook][start - 1]
+
+        # A move from or onto a king or rook home square ends the castling rights that need it there
+        self.castling &= CASTLING_MASK[start] & CASTLING_MASK[end]
+        self.en_passant_possible = divmod((start + end) >> 1, 8) if flag == DOUBLE_PAWN_PUSH else ()
         self.white_to_move = not self.white_to_move
 
-        # Check for checks or checkmate or stalemate
-        if self.check_for_checks() or len(self.get_valid_moves()) == 0:
-            self.check_for_checkmate()
+        # Put back what changed into the Zobrist key
+        key ^= zobrist.CASTLING_KEYS[self.castling] ^ self._en_passant_key()
+        self.zobrist_key = key
+
+        # Running evaluation
+        material_delta, psq_delta = evaluation.move_delta(code, piece, captured)
+        self.material += material_delta
+        self.psq_score += psq_delta
+        if captured:
+            self.piece_count -= 1
+
+        # Clocks, the fullmove number goes up after black's move
+        if piece & 7 == PAWN or captured:
+            self.halfmove_clock = 0
         else:
-            self.in_check = False
+            self.halfmove_clock += 1
+        if self.white_to_move:
+            self.fullmove_number += 1
+
+        # Append to logs
+        self.en_passant_log.append(self.en_passant_possible)
+        self.castling_log.append(self.castling)
+        self.captured_log.append(captured)
+        self.halfmove_log.append(self.halfmove_clock)
+        self.zobrist_log.append(key)
+        self.projection_log.append(code)
+        self.status_log.append({})
 
     def undo_projection(self):
         if len(self.projection_log) > 0:
-            prev_move = self.projection_log.pop()
-            self.board[prev_move.start_row][prev_move.start_col] = prev_move.piece_moved
-            self.board[prev_move.end_row][prev_move.end_col] = prev_move.piece_captured
-            
-            if prev_move.piece_moved == 'wK':
-                self.white_king_pos = prev_move.start_sq
-            elif prev_move.piece_moved == 'bK':
-                self.black_king_pos = prev_move.start_sq
-            
-            if prev_move.is_en_passant:
-                self.board[prev_move.end_row][prev_move.end_col] = '--'
-                self.board[prev_move.start_row][prev_move.end_col] = prev_move.piece_captured
-            
+            code = self.projection_log.pop()
+            captured = self.captured_log.pop()
+            squares = self.squares
+            start = code & 63
+            end = (code >> 6) & 63
+            flag = code >> 12
+            placed = squares[end]
+            piece = PAWN | (placed & BLACK_BIT) if flag & PROMOTION else placed
+
+            squares[start] = piece
+            if flag == EN_PASSANT:
+                squares[end] = EMPTY
+                squares[(start & 56) | (end & 7)] = captured
+            else:
+                squares[end] = captured
+
+            if piece & 7 == KING:
+                self.king_squares[piece >> 3] = start
+                if flag == KING_CASTLE:
+                    squares[start + 3] = squares[start + 1]
+                    squares[start + 1] = EMPTY
+                elif flag == QUEEN_CASTLE:
+                    squares[start - 4] = squares[start - 1]
+                    squares[start - 1] = EMPTY
+
+            material_delta, psq_delta = evaluation.move_delta(code, piece, captured)
+            self.material -= material_delta
+            self.psq_score -= psq_delta
+            if captured:
+                self.piece_count += 1
+
             self.en_passant_log.pop()
-            self.en_passant_possible = self.en_passant_log[-1] #(prev_move.end_row, prev_move.end_col)
+            self.en_passant_possible = self.en_passant_log[-1]
+            self.castling_log.pop()
+            self.castling = self.castling_log[-1]
+            self.halfmove_log.pop()
+            self.halfmove_clock = self.halfmove_log[-1]
+            self.zobrist_log.pop()
+            self.zobrist_key = self.zobrist_log[-1]
+            if len(self.status_log) > 1:
+                self.status_log.pop()
+            else: # Undoing past the position this projection started from
+                self.status_log[-1] = {}
 
-            if prev_move.is_castling:
-                if prev_move.end_col - prev_move.start_col > 0: # kingside castle move
-                    self.board[prev_move.end_row][prev_move.end_col+1] = self.board[prev_move.end_row][prev_move.end_col-1]
-                    self.board[prev_move.end_row][prev_move.end_col-1] = '--'
-                else: # queenside
-                    self.board[prev_move.end_row][prev_move.end_col-2] = self.board[prev_move.end_row][prev_move.end_col+1]
-                    self.board[prev_move.end_row][prev_move.end_col+1] = '--'
+            self.white_to_move = not self.white_to_move
+            if not self.white_to_move:
+                self.fullmove_number -= 1
 
-            self.castling_rights_log.pop()
-            self.curr_castling_rights = self.castling_rights_log[-1]
 
-            self.white_to_move = not self.white_to_move
-        
+    def _contents_key(self):
+        return bytes(self.squares)
 
     def get_valid_moves(self):
         """
-        All moves considering checks
-        """
-        temp_castling_rights = CastlingRights(self.curr_castling_rights.wks, self.curr_castling_rights.wqs,
-                                          self.curr_castling_rights.bks, self.curr_castling_rights.bqs)
-
-        possible_moves = self.get_all_possible_moves()
-        for m in range(len(possible_moves)-1, -1, -1):
-            move = possible_moves[m]
-            if self.check_for_checks(move):
-                possible_moves.pop(m)
-
-        self.curr_castling_rights = temp_castling_rights
-        return possible_moves
-
-    def update_castling_rights(self,move):
-        if move.piece_moved == 'wK':
-            self.curr_castling_rights.wks = False
-            self.curr_castling_rights.wqs = False
-        elif move.piece_moved == 'bK':
-            self.curr_castling_rights.bks = False
-            self.curr_castling_rights.bqs = False
-        elif move.piece_moved == 'wR':
-            if move.start_col == 0:
-                self.curr_castling_rights.wqs = False
-            elif move.start_col == 7:
-                self.curr_castling_rights.wks = False
-        elif move.piece_moved == 'bR':
-            if move.start_col == 0:
-                self.curr_castling_rights.bqs = False
-            elif move.start_col == 7:
-                self.curr_castling_rights.bks = False
-
-        if move.piece_captured == 'wR':
-            if move.end_col == 0:
-                self.curr_castling_rights.wqs = False
-            elif move.end_col == 7:
-                self.curr_castling_rights.wks = False
-        elif move.piece_captured == 'bR':
-            if move.end_col == 0:
-                self.curr_castling_rights.bqs = False
-            elif move.end_col == 7:
-                self.curr_castling_rights.bks = False
-
-    def square_under_attack(self,r,c,board=None):
-        if board == None:
-            board = self.board
+        All legal moves as Move objects, for the UI, notation and the root of the AIs.
+        The search itself works on generate_legal_moves.
+        """
+        board = self.board.to_list() # Move reads board[r][c] twice per move, a plain list is quicker than the view
+        return [Move.from_code(code, board) for code in self.generate_legal_moves()]
 
-        if self.white_to_move:
-            enemy_colour = 'b'
-            pawn_directions = [(-1,-1), (-1,1)]
+    def generate_legal_moves(self, first_only=False, captures_only=False):
+        """
+        All legal moves as 16-bit codes in an array('H'), stopping after the first piece with a legal move if first_only.
+        captures_only leaves out castling and the quiet moves other than promotions, for quiescence search.
+        Checks and pins are found once up front, so only king moves and en passant
+        still need to be tried on the board to see if they leave the king attacked.
+        """
+        squares = self.squares
+        us = WHITE if self.white_to_move else BLACK
+        them = us ^ 1
+        king = self.king_squares[us]
+        checkers, evasions, pins = self.checks_and_pins(king, us)
+        in_check = len(checkers) > 0
+        status = self.status_log[-1]
+        status['check'] = in_check
+
+        moves = array('H')
+        add = moves.append
+
+        # The king is lifted off the board while its targets are tested, so it cannot shield them from a slider
+        king_code = squares[king]
+        squares[king] = EMPTY
+        for t in KING_TARGETS[king]:
+            target = squares[t]
+            if target:
+                if target >> 3 == us:
+                    continue
+            elif captures_only:
+                continue
+            if not self.square_attacked(t, them):
+                add(king | (t << 6) | (CAPTURE << 12 if target else 0))
+        squares[king] = king_code
+        if len(checkers) > 1: # Double check, only the king can move
+            if not first_only and not captures_only:
+                status['has_legal_move'] = len(moves) > 0
+            return moves
+
+        # Castling, the king may not start on, cross or land on an attacked square
+        if not in_check and self.castling and not captures_only:
+            if us == WHITE:
+                if (self.castling & WKS and not squares[61] and not squares[62]
+                        and not self.square_attacked(61, them) and not self.square_attacked(62, them)):
+                    add(60 | (62 << 6) | (KING_CASTLE << 12))
+                if (self.castling & WQS and not squares[59] and not squares[58] and not squares[57]
+                        and not self.square_attacked(59, them) and not self.square_attacked(58, them)):
+                    add(60 | (58 << 6) | (QUEEN_CASTLE << 12))
+            else:
+                if (self.castling & BKS and not squares[5] and not squares[6]
+                        and not self.square_attacked(5, them) and not self.square_attacked(6, them)):
+                    add(4 | (6 << 6) | (KING_CASTLE << 12))
+                if (self.castling & BQS and not squares[3] and not squares[2] and not squares[1]
+                        and not self.square_attacked(3, them) and not self.square_attacked(2, them)):
+                    add(4 | (2 << 6) | (QUEEN_CASTLE << 12))
+
+        if self.underpromotions:
+            promotion_flags = (PROMOTION | 3, PROMOTION | 2, PROMOTION | 1, PROMOTION)
         else:
-            enemy_colour = 'w'
-            pawn_directions = [(1,-1), (1,1)]
-
-        # Rook / Queen checks
-        directions = [(-1,0), (0,1), (1,0), (0,-1)]
-        for d in directions:
-            for i in range(1,8):
-                tgt_r = r + d[0] * i
-                tgt_c = c + d[1] * i
-                if 0 <= tgt_r <= 7 and 0 <= tgt_c <= 7: # Set boundaries
-                    tgt_piece = board[tgt_r][tgt_c]
-                    if tgt_piece == '--':
-                        continue
-                    else:
-                        if tgt_piece[0] != enemy_colour:
+            promotion_flags = (PROMOTION | 3,)
+        forward, home_row, last_row = (-8, 6, 0) if us == WHITE else (8, 1, 7)
+        en_passant = self.en_passant_possible[0] * 8 + self.en_passant_possible[1] if self.en_passant_possible else -1
+        pawn_captures = PAWN_CAPTURES[us]
+
+        for sq, code in enumerate(squares):
+            if not code or code >> 3 != us:
+                continue
+            if first_only and moves:
+                break
+            kind = code & 7
+            if kind == KING:
+                continue
+            # Squares the piece may move to when in check or pinned, None when it is free to move anywhere
+            restrict = evasions
+            pin_line = pins.get(sq)
+            if pin_line is not None:
+                restrict = pin_line if restrict is None else pin_line & restrict
+
+            if kind == PAWN:
+                one = sq + forward
+                if not squares[one]:
+                    if one >> 3 == last_row:
+                        if restrict is None or one in restrict:
+                            for flag in promotion_flags:
+                                add(sq | (one << 6) | (flag << 12))
+                    elif not captures_only:
+                        if restrict is None or one in restrict:
+                            add(sq | (one << 6))
+                        two = one + forward
+                        if sq >> 3 == home_row and not squares[two] and (restrict is None or two in restrict):
+                            add(sq | (two << 6) | (DOUBLE_PAWN_PUSH << 12))
+                for t in pawn_captures[sq]:
+                    target = squares[t]
+                    if target:
+                        if target >> 3 == them and (restrict is None or t in restrict):
+                            if t >> 3 == last_row:
+                                for flag in promotion_flags:
+                                    add(sq | (t << 6) | ((flag | CAPTURE) << 12))
+                            else:
+                                add(sq | (t << 6) | (CAPTURE << 12))
+                    elif t == en_passant and self._en_passant_is_legal(sq, t, us):
+                        add(sq | (t << 6) | (EN_PASSANT << 12))
+
+            elif kind == KNIGHT:
+                if pin_line is not None: # A pinned knight can never move
+                    continue
+                for t in KNIGHT_TARGETS[sq]:
+                    target = squares[t]
+                    if not target:
+                        if not captures_only and (restrict is None or t in restrict):
+                            add(sq | (t << 6))
+                    elif target >> 3 == them and (restrict is None or t in restrict):
+                        add(sq | (t << 6) | (CAPTURE << 12))
+
+            elif captures_only:
+                for ray in SLIDER_RAYS[kind][sq]:
+                    for t in ray:
+                        target = squares[t]
+                        if target:
+                            if target >> 3 == them and (restrict is None or t in restrict):
+                                add(sq | (t << 6) | (CAPTURE << 12))
                             break
-                        elif tgt_piece[0] == enemy_colour and tgt_piece[1] in ['R','Q']:
-                            return True
-                else: # Beyond board boundaries
-                    break
+            elif restrict is None:
+                for ray in SLIDER_RAYS[kind][sq]:
+                    for t in ray:
+                        target = squares[t]
+                        if not target:
+                            add(sq | (t << 6))
+                        else:
+                            if target >> 3 == them:
+                                add(sq | (t << 6) | (CAPTURE << 12))
+                            break
+            else:
+                for ray in SLIDER_RAYS[kind][sq]:
+                    for t in ray:
+                        target = squares[t]
+                        if not target:
+                            if t in restrict:
+                                add(sq | (t << 6))
+                        else:
+                            if target >> 3 == them and t in restrict:
+                                add(sq | (t << 6) | (CAPTURE << 12))
+                            break
+
+        if not first_only and not captures_only:
+            status['has_legal_move'] = len(moves) > 0
+        return moves
 
-        # Bishop / Queen checks
-        directions = [(-1,-1), (-1,1), (1,-1), (1,1)]
-        for d in directions:
-            for i in range(1,8):
-                tgt_r = r + d[0] * i
-                tgt_c = c + d[1] * i
-                if 0 <= tgt_r <= 7 and 0 <= tgt_c <= 7: # Set boundaries
-                    tgt_piece = board[tgt_r][tgt_c]
-                    if tgt_piece == '--':
-                        continue
+    def checks_and_pins(self, king, colour):
+        """
+        Walks out from the king of colour on square king.
+        Returns the squares of the pieces giving check, the squares that capture or block a single
+        check (None when not in check) and the pinned pieces as {square: squares along the pin line}.
+        """
+        squares = self.squares
+        checkers = []
+        evasions = None
+        pins = {}
+        for direction, ray in enumerate(QUEEN_RAYS[king]):
+            slider = ROOK if direction < 4 else BISHOP
+            own = -1
+            for i, t in enumerate(ray):
+                code = squares[t]
+                if not code:
+                    continue
+                if code >> 3 == colour: # Own piece, may be pinned
+                    if own >= 0:
+                        break
+                    own = t
+                    continue
+                if code & 7 == slider or code & 7 == QUEEN:
+                    line = set(ray[:i + 1])
+                    if own >= 0:
+                        pins[own] = line
                     else:
-                        if tgt_piece[0] != enemy_colour:
-                            break
-                        elif tgt_piece[0] == enemy_colour and tgt_piece[1] in ['B','Q']: # Empty space
+                        checkers.append(t)
+                        evasions = line
+                break
+
+        enemy_bit = (colour ^ 1) * BLACK_BIT
+        knight = KNIGHT | enemy_bit
+        for t in KNIGHT_TARGETS[king]:
+            if squares[t] == knight:
+                checkers.append(t)
+                evasions = {t}
+        pawn = PAWN | enemy_bit
+        for t in PAWN_CAPTURES[colour][king]: # An enemy pawn checks from where a pawn of ours on the king's square would capture
+            if squares[t] == pawn:
+                checkers.append(t)
+                evasions = {t}
+        return checkers, evasions, pins
+
+    def _en_passant_is_legal(self, start, end, colour):
+        """
+        Whether capturing en passant leaves the king of colour safe. Both pawns leave the same rank,
+        which pin detection does not see, so the capture is tried on the board.
+        """
+        squares = self.squares
+        captured_sq = (start & 56) | (end & 7)
+        pawn = squares[start]
+        captured = squares[captured_sq]
+        squares[start] = EMPTY
+        squares[captured_sq] = EMPTY
+        squares[end] = pawn
+        legal = not self.square_attacked(self.king_squares[colour], colour ^ 1)
+        squares[start] = pawn
+        squares[captured_sq] = captured
+        squares[end] = EMPTY
+        return legal
+
+    def square_attacked(self, sq, colour):
+        """
+        Whether a piece of colour (WHITE or BLACK) attacks sq
+        """
+        squares = self.squares
+        colour_bit = colour * BLACK_BIT
+        knight = KNIGHT | colour_bit
+        for t in KNIGHT_TARGETS[sq]:
+            if squares[t] == knight:
+                return True
+        pawn = PAWN | colour_bit
+        for t in PAWN_CAPTURES[colour ^ 1][sq]: # A pawn attacking sq stands where an enemy pawn on sq would capture
+            if squares[t] == pawn:
+                return True
+        king = KING | colour_bit
+        for t in KING_TARGETS[sq]:
+            if squares[t] == king:
+                return True
+        queen = QUEEN | colour_bit
+        for rays, slider in ((ROOK_RAYS[sq], ROOK | colour_bit), (BISHOP_RAYS[sq], BISHOP | colour_bit)):
+            for ray in rays:
+                for t in ray:
+                    code = squares[t]
+                    if code:
+                        if code == slider or code == queen:
                             return True
-                else: # Beyond board boundaries
-                    break
-
-        # Knight checks
-        directions = [(-2,-1), (-1,-2), (1,-2), (2,-1), (2,1), (1,2), (-1,2), (-2,1)]
-        for d in directions:
-            tgt_r = r + d[0]
-            tgt_c = c + d[1]
-            if 0 <= tgt_r <= 7 and 0 <= tgt_c <= 7: 
-                tgt_piece = board[tgt_r][tgt_c]
-                if tgt_piece[0] == enemy_colour and tgt_piece[1] == 'N':
-                    return True
-
-        # Pawn checks
-        for d in pawn_directions:
-            tgt_r = r + d[0]
-            tgt_c = c + d[1]
-            if 0 <= tgt_r <= 7 and 0 <= tgt_c <= 7:
-                tgt_piece = board[tgt_r][tgt_c]
-                if tgt_piece[0] == enemy_colour and tgt_piece[1] == 'P':
-                    return True
-
-        # King checks
-        directions = [(-1,0), (0,1), (1,0), (0,-1), (-1,-1), (-1,1), (1,-1), (1,1)]
-        for d in directions:
-            tgt_r = r + d[0]
-            tgt_c = c + d[1]
-            if 0 <= tgt_r <= 7 and 0 <= tgt_c <= 7: 
-                tgt_piece = board[tgt_r][tgt_c]
-                if tgt_piece[0] == enemy_colour and tgt_piece[1] == 'K':
-                    return True
-
-        # End
+                        break # Any other piece blocks the line
         return False
-        
-    def check_for_checks(self, move=None):
-        # for king piece, check rook, pawn, knight or bishop attack    
-        
-        # test the move for checks
-        test_board = copy.deepcopy(self.board)
-        if move:
-            test_board[move.start_row][move.start_col] = '--'
-            test_board[move.end_row][move.end_col] = move.piece_moved
-        
-        test_white_king_pos, test_black_king_pos = None, None
-        for row in range(GAME_CONFIG.DIMENSION):
-            for col in range(GAME_CONFIG.DIMENSION):
-                if test_white_king_pos and test_black_king_pos:
-                    break
-                if test_board[row][col][1] == 'K':
-                    if test_board[row][col][0] == 'w':
-                        test_white_king_pos = (row,col)
-                    else:
-                        test_black_king_pos = (row,col)
 
-        # check player team
-        if self.white_to_move:
-            r = test_white_king_pos[0]
-            c = test_white_king_pos[1]
-        else:
-            r = test_black_king_pos[0]
-            c = test_black_king_pos[1]
+    def is_check(self):
+        """
+        Whether the team to move is in check, cached per position
+        """
+        status = self.status_log[-1]
+        if 'check' not in status:
+            us = WHITE if self.white_to_move else BLACK
+            status['check'] = self.square_attacked(self.king_squares[us], us ^ 1)
+        return status['check']
+
+    def has_legal_move(self):
+        """
+        Whether the team to move has any legal move, stopping at the first piece with one.
+        Cached per position
+        """
+        status = self.status_log[-1]
+        if 'has_legal_move' not in status:
+            status['has_legal_move'] = len(self.generate_legal_moves(first_only=True)) > 0
+        return status['has_legal_move']
 
-        return self.square_under_attack(r,c,test_board)
+    def is_checkmate(self):
+        return self.is_check() and not self.has_legal_move()
 
+    def is_stalemate(self):
+        return not self.is_check() and not self.has_legal_move()
 
-    def get_all_possible_moves(self):
+    def repetition_count(self, stop_at=3):
         """
-        All moves without considering checks
+        Times the current position has occurred, this one included, counting no further than stop_at.
+        Positions are compared by Zobrist key, and only those since the last capture or pawn move can repeat.
         """
-        moves = []
-        for r in range(GAME_CONFIG.DIMENSION):
-            for c in range(GAME_CONFIG.DIMENSION):
-                if self.board[r][c] == '--':
-                    continue
-                else:
-                    team = self.board[r][c][0]
-                    if (team == 'w' and self.white_to_move) or (team == 'b' and not self.white_to_move):
-                        piece = self.board[r][c][1]
-                        self.move_functions[piece](r,c,moves)
-        return moves
-
-    def get_pawn_moves(self,r,c,moves):
-        if self.white_to_move: # White pawn logic
-            if self.board[r-1][c] == '--': # All 1-square pawn advance
-                moves.append(Move((r,c), (r-1,c), self.board))
-                if r == 6 and self.board[r-2][c] == '--': # 2-square pawn advance
-                    moves.append(Move((r,c), (r-2,c), self.board))
-            if c-1 >= 0:
-                if self.board[r-1][c-1][0] == 'b':
-                    moves.append(Move((r,c), (r-1,c-1), self.board))
-                elif (r-1,c-1) == self.en_passant_possible:
-                    moves.append(Move((r,c), (r-1,c-1), self.board, is_en_passant=True))
-            
-            if c+1 <= 7:
-                if self.board[r-1][c+1][0] == 'b':
-                    moves.append(Move((r,c), (r-1,c+1), self.board))
-                elif (r-1,c+1) == self.en_passant_possible:
-                    moves.append(Move((r,c), (r-1,c+1), self.board, is_en_passant=True))
-
-        else: # Black pawn logic
-            if self.board[r+1][c] == '--': # All 1-square pawn advance
-                moves.append(Move((r,c), (r+1,c), self.board))
-                if r == 1 and self.board[r+2][c] == '--': # 2-square pawn advance
-                    moves.append(Move((r,c), (r+2,c), self.board))
-            if c-1 >= 0:
-                if self.board[r+1][c-1][0] == 'w':
-                    moves.append(Move((r,c), (r+1,c-1), self.board))
-                elif (r+1,c-1) == self.en_passant_possible:
-                    moves.append(Move((r,c), (r+1,c-1), self.board, is_en_passant=True))
-
-            if c+1 <= 7:
-                if self.board[r+1][c+1][0] == 'w':
-                    moves.append(Move((r,c), (r+1,c+1), self.board))
-                elif (r+1,c+1) == self.en_passant_possible:
-                    moves.append(Move((r,c), (r+1,c+1), self.board, is_en_passant=True))
-
-    def get_rook_moves(self,r,c,moves):
-        directions = [(-1,0), (0,1), (1,0), (0,-1)]
-        enemy_colour = 'b' if self.white_to_move else 'w'
-        for d in directions:
-            for i in range(1,8):
-                tgt_r = r + d[0] * i
-                tgt_c = c + d[1] * i
-                if 0 <= tgt_r <= 7 and 0 <= tgt_c <= 7: # Set boundaries
-                    tgt_piece = self.board[tgt_r][tgt_c]
-                    if tgt_piece == '--': # Empty space
-                        moves.append(Move((r,c), (tgt_r, tgt_c), self.board))
-                    elif tgt_piece[0] == enemy_colour: # Enemy piece
-                        moves.append(Move((r,c), (tgt_r, tgt_c), self.board))
-                        break
-                    else: # Own piece
-                        break
-                else: # Beyond board boundaries
-                    break
-             
-    def get_knight_moves(self,r,c,moves):
-        directions = [(-2,-1), (-1,-2), (1,-2), (2,-1), (2,1), (1,2), (-1,2), (-2,1)]
-        enemy_colour = 'b' if self.white_to_move else 'w'
-        for d in directions:
-            tgt_r = r + d[0]
-            tgt_c = c + d[1]
-            if 0 <= tgt_r <= 7 and 0 <= tgt_c <= 7: 
-                tgt_piece = self.board[tgt_r][tgt_c]
-                if tgt_piece == '--' or tgt_piece[0] == enemy_colour:
-                    moves.append(Move((r,c), (tgt_r,tgt_c), self.board))
-
-    def get_bishop_moves(self,r,c,moves):
-        directions = [(-1,-1), (-1,1), (1,-1), (1,1)]
-        enemy_colour = 'b' if self.white_to_move else 'w'
-        for d in directions:
-            for i in range(1,8):
-                tgt_r = r + d[0] * i
-                tgt_c = c + d[1] * i
-                if 0 <= tgt_r <= 7 and 0 <= tgt_c <= 7: # Set boundaries
-                    tgt_piece = self.board[tgt_r][tgt_c]
-                    if tgt_piece == '--': # Empty space
-                        moves.append(Move((r,c), (tgt_r, tgt_c), self.board))
-                    elif tgt_piece[0] == enemy_colour: # Enemy piece
-                        moves.append(Move((r,c), (tgt_r, tgt_c), self.board))
-                        break
-                    else: # Own piece
-                        break
-                else: # Beyond board boundaries
+        key = self.zobrist_key
+        log = self.zobrist_log
+        last = len(log) - 1
+        oldest = max(last - self.halfmove_clock, 0)
+        count = 1
+        for i in range(last - 4, oldest - 1, -2): # Same side to move, at least four plies back
+            if log[i] == key:
+                count += 1
+                if count >= stop_at:
                     break
+        return count
 
-    def get_queen_moves(self,r,c,moves):
-        directions = [(-1,0), (0,1), (1,0), (0,-1), (-1,-1), (-1,1), (1,-1), (1,1)]
-        enemy_colour = 'b' if self.white_to_move else 'w'
-        for d in directions:
-            for i in range(1,8):
-                tgt_r = r + d[0] * i
-                tgt_c = c + d[1] * i
-                if 0 <= tgt_r <= 7 and 0 <= tgt_c <= 7: # Set boundaries
-                    tgt_piece = self.board[tgt_r][tgt_c]
-                    if tgt_piece == '--': # Empty space
-                        moves.append(Move((r,c), (tgt_r, tgt_c), self.board))
-                    elif tgt_piece[0] == enemy_colour: # Enemy piece
-                        moves.append(Move((r,c), (tgt_r, tgt_c), self.board))
-                        break
-                    else: # Own piece
-                        break
-                else: # Beyond board boundaries
-                    break
+    def is_repetition(self):
+        """
+        Whether the current position occurred before, the search scores that as a draw
+        """
+        return self.repetition_count(2) >= 2
 
-    def get_king_moves(self,r,c,moves):
-        directions = [(-1,0), (0,1), (1,0), (0,-1), (-1,-1), (-1,1), (1,-1), (1,1)]
-        enemy_colour = 'b' if self.white_to_move else 'w'
-        for d in directions:
-            tgt_r = r + d[0]
-            tgt_c = c + d[1]
-            if 0 <= tgt_r <= 7 and 0 <= tgt_c <= 7: # Set boundaries
-                tgt_piece = self.board[tgt_r][tgt_c]
-                if tgt_piece == '--' or tgt_piece[0] == enemy_colour: # Empty space
-                    moves.append(Move((r,c), (tgt_r, tgt_c), self.board))
-        self.get_castling_moves(r,c,moves)
-
-    def get_castling_moves(self,r,c,moves):
-        if not self.in_check:
-            if (self.white_to_move and self.curr_castling_rights.wks) or ((not self.white_to_move) and self.curr_castling_rights.bks):
-                self.get_kingside_castling_moves(r,c,moves)
-            if (self.white_to_move and self.curr_castling_rights.wqs) or ((not self.white_to_move) and self.curr_castling_rights.bqs):
-                self.get_queenside_castling_moves(r,c,moves)
-    
-    def get_kingside_castling_moves(self,r,c,moves):
-        if self.board[r][c+1] == '--' and self.board[r][c+2] == '--':
-            if not self.square_under_attack(r, c+1) and not self.square_under_attack(r,c+2):
-                moves.append(Move((r,c),(r,c+2), self.board, is_castling=True))
+    def is_threefold_repetition(self):
+        return self.repetition_count(3) >= 3
+
+    def is_fifty_move_draw(self):
+        """
+        Whether fifty moves each went by without a capture or pawn move, unless the last one gave checkmate
+        """
+        return self.halfmove_clock >= 100 and not self.is_checkmate()
 
-    def get_queenside_castling_moves(self,r,c,moves):
-        if self.board[r][c-1] == '--' and self.board[r][c-2] == '--' and self.board[r][c-3] == '--':
-            if not self.square_under_attack(r, c-1) and not self.square_under_attack(r,c-2):
-                moves.append(Move((r,c),(r,c-2), self.board, is_castling=True))
+    def attackers(self, sq, colour, squares=None):
+        """
+        Pieces of colour (WHITE or BLACK) attacking sq as (value, square), least valuable first.
+        Pins are not considered.
+        """
+        if squares is None:
+            squares = self.squares
+        found = []
+        colour_bit = colour * BLACK_BIT
+
+        # Rook / Queen and Bishop / Queen lines
+        queen = QUEEN | colour_bit
+        for direction, ray in enumerate(QUEEN_RAYS[sq]):
+            slider = (ROOK if direction < 4 else BISHOP) | colour_bit
+            for t in ray:
+                code = squares[t]
+                if code:
+                    if code == slider or code == queen:
+                        found.append((EXCHANGE_BY_KIND[code & 7], t))
+                    break # Any other piece blocks the line
+
+        for kind, targets in ((KNIGHT, KNIGHT_TARGETS[sq]), (PAWN, PAWN_CAPTURES[colour ^ 1][sq]), (KING, KING_TARGETS[sq])):
+            piece = kind | colour_bit
+            for t in targets:
+                if squares[t] == piece:
+                    found.append((EXCHANGE_BY_KIND[kind], t))
+
+        found.sort()
+        return found
+
+    @staticmethod
+    def _xray_attacker(sq, from_sq, squares):
+        """
+        Slider lined up behind the piece on from_sq that attacks sq once that piece has moved,
+        as (colour, (value, square)), or None
+        """
+        direction = RAY_TOWARDS[sq * 64 + from_sq]
+        if direction < 0:
+            return None # Knight, nothing can line up behind it
+        slider = ROOK if direction < 4 else BISHOP
+        ray = QUEEN_RAYS[sq][direction]
+        for t in ray[ray.index(from_sq) + 1:]:
+            code = squares[t]
+            if code:
+                if code & 7 == slider or code & 7 == QUEEN:
+                    return code >> 3, (EXCHANGE_BY_KIND[code & 7], t)
+                return None
+        return None
+
+    def static_exchange(self, code):
+        """
+        Material the side to move gains by the move with code once every capture back and forth on its
+        end square is played out, each side capturing with its least valuable attacker and free to stop
+        when capturing on would lose. In centipawns, worked out without making any moves.
+        """
+        start = code & 63
+        end = (code >> 6) & 63
+        flag = code >> 12
+        squares = self.squares
+        piece = squares[start]
+        mover = piece >> 3
+        opponent = mover ^ 1
+        captured = squares[end]
+        if flag == EN_PASSANT: # The captured pawn is not on the end square and may be screening a line onto it
+            squares = bytearray(squares)
+            squares[(start & 56) | (end & 7)] = EMPTY
+            captured = PAWN
+
+        gains = [EXCHANGE_BY_KIND[captured & 7]]
+        on_square = EXCHANGE_BY_KIND[piece & 7]
+        if flag & PROMOTION:
+            promoted = EXCHANGE_BY_KIND[KNIGHT + (flag & 3)]
+            gains[0] += promoted - on_square
+            on_square = promoted
+
+        attackers = [None, None]
+        attackers[mover] = self.attackers(end, mover, squares)
+        attackers[opponent] = self.attackers(end, opponent, squares)
+        first = (EXCHANGE_BY_KIND[piece & 7], start)
+        if first in attackers[mover]: # Not there for pawn pushes
+            attackers[mover].remove(first)
+        xray = self._xray_attacker(end, start, squares)
+        if xray is not None:
+            insort(attackers[xray[0]], xray[1])
+
+        side = opponent
+        while attackers[side]:
+            other = side ^ 1
+            value, from_sq = attackers[side].pop(0)
+            if value == EXCHANGE_VALUES['K'] and attackers[other]:
+                break # The king cannot capture onto a defended square
+            gains.append(on_square - gains[-1])
+            on_square = value
+            xray = self._xray_attacker(end, from_sq, squares)
+            if xray is not None:
+                insort(attackers[xray[0]], xray[1])
+            side = other
+
+        # Each side only captures when it does not lose by doing so
+        for i in range(len(gains) - 1, 0, -1):
+            gains[i - 1] = -max(-gains[i - 1], gains[i])
+        return gains[0]
 
 
     def check_for_checkmate(self):
-        current_moves = self.get_valid_moves()
-
-        if len(current_moves) == 0 and not self.check_for_checks():
-            print('Stalemate')
-
-        elif len(current_moves) == 0 and self.check_for_checks():
-            winner = 'Black' if self.white_to_move else 'White'
-            loser = 'White' if self.white_to_move else 'Black'
-            self.in_check = True
-            self.checkmate = True
-            # TODO - escape this to the gamestate via attributes
-            # print('CHECKMATE for', loser)
-            # print(winner, 'wins!')
+        """
+        Updates the in_check, checkmate, stalemate and draw attributes for the current position
+        """
+        self.in_check = self.is_check()
+        self.checkmate = self.is_checkmate()
+        self.stalemate = self.is_stalemate()
+        self.threefold_repetition = self.is_threefold_repetition()
+        self.fifty_move_draw = self.is_fifty_move_draw()
+
+    def san(self, move, moves=None):
+        """
+        Standard algebraic notation of a legal move in the projected position, e.g. Nbd7, exd6, e8=Q+ or O-O#.
+        moves, the legal moves of the position, saves generating them again.
+        """
+        if move.is_castling:
+            notation = 'O-O' if move.end_col > move.start_col else 'O-O-O'
         else:
-            enemy_team = 'White' if self.white_to_move else 'Black'
-            self.in_check = True
-            # print('CHECK on', enemy_team)
+            piece = move.piece_moved[1]
+            target = move.get_rank_file(move.end_row, move.end_col)
+            capture = 'x' if move.piece_captured != '--' else ''
+            if piece == 'P':
+                notation = (Move.colsToFiles[move.start_col] + capture if capture else '') + target
+                if move.is_pawn_promotion:
+                    notation += '=' + move.promotion_piece
+            else:
+                if moves is None:
+                    moves = self.get_valid_moves()
+                rivals = [other.start_sq for other in moves if other.piece_moved == move.piece_moved
+                          and other.end_sq == move.end_sq and other.start_sq != move.start_sq]
+                disambiguation = ''
+                if rivals:
+                    if all(col != move.start_col for _, col in rivals):
+                        disambiguation = Move.colsToFiles[move.start_col]
+                    elif all(row != move.start_row for row, _ in rivals):
+                        disambiguation = Move.rowsToRanks[move.start_row]
+                    else:
+                        disambiguation = move.get_rank_file(move.start_row, move.start_col)
+                notation = piece + disambiguation + capture + target
 
-        
+        self.make_projection(move.move_id)
+        if self.is_check():
+            notation += '+' if self.has_legal_move() else '#'
+        self.undo_projection()
+        return notation
+
+    def parse_san(self, text, moves=None):
+        """
+        Legal Move for a move in standard algebraic notation in the projected position.
+        Check marks and annotations such as + # ! ? are ignored, and 0-0 is read as O-O.
+        Raises ValueError when the move is malformed, illegal or ambiguous.
+        """
+        if moves is None:
+            moves = self.get_valid_moves()
+        san = text.rstrip('+#!?').replace('0', 'O')
+        if san in ('O-O', 'O-O-O'):
+            for move in moves:
+                if move.is_castling and (move.end_col > move.start_col) == (san == 'O-O'):
+                    return move
+            raise ValueError(f'{text} is not a legal move')
+
+        match = SAN_PATTERN.match(san)
+        if match is None:
+            raise ValueError(f"'{text}' is not a move in standard algebraic notation")
+        piece, from_file, from_rank, _, target, promotion_piece = match.groups()
+        piece = piece or 'P'
+        end_sq = (Move.ranksToRows[target[1]], Move.filesToCols[target[0]])
+        candidates = [move for move in moves if move.piece_moved[1] == piece and move.end_sq == end_sq
+                      and (from_file is None or move.start_col == Move.filesToCols[from_file])
+                      and (from_rank is None or move.start_row == Move.ranksToRows[from_rank])]
+        if candidates and candidates[0].is_pawn_promotion:
+            # Keep one move per start square, with underpromotions there is one per promotion piece
+            promotion_piece = promotion_piece or 'Q'
+            candidates = list({move.start_sq: move for move in candidates if move.promotion_piece == promotion_piece
+                               or not self.underpromotions}.values())
+        if len(candidates) != 1:
+            raise ValueError(f'{text} is {"ambiguous" if candidates else "not a legal move"}')
+        move = candidates[0]
+        if move.is_pawn_promotion and promotion_piece != move.promotion_piece:
+            return Move(move.start_sq, move.end_sq, self.board, promotion_piece=promotion_piece)
+        return move
 
 
 
 
 
 class Move:
+    """
+    A move with the details the UI, notation and make_projection need.
+    move_id is the 16-bit code from app.move_encoding, used for equality and hashing.
+    """
+    __slots__ = ('start_sq', 'start_row', 'start_col', 'end_sq', 'end_row', 'end_col', 'piece_moved', 'piece_captured',
+                 'is_pawn_promotion', 'promotion_piece', 'is_en_passant', 'is_castling', 'move_id')
 
     ranksToRows = {
         '1' :7,
@@ -456,40 +732,60 @@ class Move:
     }
     rowsToRanks = {v: k for k, v in ranksToRows.items()}
     filesToCols = {
-        'a' :7,
-        'b' :6,
-        'c' :5,
-        'd' :4,
-        'e' :3,
-        'f' :2,
-        'g' :1,
-        'h' :0
+        'a' :0,
+        'b' :1,
+        'c' :2,
+        'd' :3,
+        'e' :4,
+        'f' :5,
+        'g' :6,
+        'h' :7
     }
     colsToFiles = {v: k for k, v in filesToCols.items()}
+    promotion_pieces = 'QRBN'
 
 
-    def __init__(self, start_sq, end_sq, board, is_en_passant=False, is_castling=False):
+    def __init__(self, start_sq, end_sq, board, is_en_passant=False, is_castling=False, promotion_piece='Q'):
+        start_row, start_col = start_sq
+        end_row, end_col = end_sq
         self.start_sq = start_sq
-        self.start_row = start_sq[0]
-        self.start_col = start_sq[1]
+        self.start_row = start_row
+        self.start_col = start_col
         self.end_sq = end_sq
-        self.end_row = end_sq[0]
-        self.end_col = end_sq[1]
-        self.piece_moved = board[self.start_row][self.start_col]
-        self.piece_captured = board[self.end_row][self.end_col]
-        self.move_id = str(self.start_row * 1000 + self.start_col * 100 + self.end_row * 10 + self.end_col).zfill(4)
-        
-        # Pawn Promotions
-        self.is_pawn_promotion = (self.piece_moved == 'wP' and self.end_row == 0) or (self.piece_moved == 'bP' and self.end_row == 7)
-        
-        # En Passant
+        self.end_row = end_row
+        self.end_col = end_col
+        self.piece_moved = piece_moved = board[start_row][start_col]
+        self.piece_captured = board[end_row][end_col]
         self.is_en_passant = is_en_passant
-        if self.is_en_passant:
-            self.piece_captured = 'wP' if self.piece_moved == 'bP' else 'bP'
-
-        # Castling
         self.is_castling = is_castling
 
+        # Pawn Promotions
+        self.is_pawn_promotion = (piece_moved == 'wP' and end_row == 0) or (piece_moved == 'bP' and end_row == 7)
+        self.promotion_piece = promotion_piece if self.is_pawn_promotion else None
+
+        if is_en_passant:
+            self.piece_captured = 'wP' if piece_moved == 'bP' else 'bP'
+            flag = EN_PASSANT
+        elif is_castling:
+            flag = KING_CASTLE if end_col > start_col else QUEEN_CASTLE
+        else:
+            flag = QUIET if self.piece_captured == '--' else CAPTURE
+            if self.is_pawn_promotion:
+                flag |= PROMOTION | PROMOTION_LETTERS.index(promotion_piece)
+            elif piece_moved[1] == 'P' and (end_row - start_row == 2 or start_row - end_row == 2):
+                flag = DOUBLE_PAWN_PUSH
+        self.move_id = (start_row << 3 | start_col) | (end_row << 3 | end_col) << 6 | flag << 12
+
+    @classmethod
+    def from_code(cls, code, board):
+        """
+        Move for a 16-bit move code in the position on board
+        """
+        flag = move_flag(code)
+        return cls(divmod(move_start(code), 8), divmod(move_end(code), 8), board,
+                   is_en_passant=flag == EN_PASSANT, is_castling=flag == KING_CASTLE or flag == QUEEN_CASTLE,
+                   promotion_piece=PROMOTION_LETTERS[flag & 3] if flag & PROMOTION else 'Q')
+
     def __eq__(self, other):
         """
         Equals method
@@ -498,8 +794,17 @@ class Move:
             return self.move_id == other.move_id
         return False
 
+    def __hash__(self):
+        return self.move_id
+
     def get_chess_notation(self):
-        return self.get_rank_file(self.start_row, self.start_col) + self.get_rank_file(self.end_row, self.end_col) 
+        """
+        Long algebraic notation, e.g. e2e4 or e7e8q, see Projection.san for standard algebraic notation
+        """
+        notation = self.get_rank_file(self.start_row, self.start_col) + self.get_rank_file(self.end_row, self.end_col)
+        if self.is_pawn_promotion:
+            notation += self.promotion_piece.lower()
+        return notation
 
     def get_rank_file(self, r, c):
         return self.colsToFiles[c] + self.rowsToRanks[r]
@@ -513,6 +818,22 @@ class CastlingRights:
         self.bks = bks
         self.bqs = bqs
 
+    @classmethod
+    def from_bits(cls, bits):
+        return cls(bool(bits & WKS), bool(bits & WQS), bool(bits & BKS), bool(bits & BQS))
+
+    def to_bits(self):
+        """
+        Rights as WKS | WQS | BKS | BQS bits, as Projection keeps them
+        """
+        return self.wks * WKS | self.wqs * WQS | self.bks * BKS | self.bqs * BQS
+
+    def to_fen(self):
+        """
+        Rights as in a FEN, e.g. 'KQk', '-' for none
+        """
+        return ''.join(letter for letter, right in zip('KQkq', (self.wks, self.wqs, self.bks, self.bqs)) if right) or '-'
+
     def get_rights(self):
         cr_id = str(self.wks * 1000 + self.wqs * 100 + self.bks * 10 + self.bqs * 1).zfill(4)
         print(cr_id)
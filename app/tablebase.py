@@ -0,0 +1,526 @@
+"""
+Endgame tablebases for small material, generated locally by retrograde analysis.
+
+A table covers one material signature, written white's pieces then black's,
+e.g. KQK, KRK or KPK, and stores every position with its squares as the index:
+side to move, then the square of each piece in signature order. Two files are
+written per table:
+
+    <name>.dtm  one byte per position: 0 draw, d a win for the side to move
+                in d plies, 128 + d a loss in d plies, 255 an illegal position
+    <name>.wdl  two bits per position: 0 illegal, 1 loss, 2 draw, 3 win
+
+Generation starts from the checkmates and the moves that leave the table
+(captures and promotions, looked up in smaller tables) and works backwards
+through un-moves, so every position is solved once. Positions with black
+holding the stronger side are probed through the table with colours swapped
+and the board mirrored. Castling rights and en passant are not part of the
+index. Three pieces take seconds to generate, four take a long while in pure
+Python.
+
+    python -m app.tablebase generate KQK KRK KPK --directory tablebases
+"""
+import argparse, mmap, os, time
+from itertools import product
+
+from app.evaluation import PIECE_VALUES
+from app.mailbox import PIECE_NAMES, ROOK_RAYS, BISHOP_RAYS, QUEEN_RAYS, KNIGHT_TARGETS, KING_TARGETS, PAWN_CAPTURES
+from app.projection_engine import Move
+
+DRAW = 0
+LOSS = 128 # LOSS + d: the side to move is mated in d plies
+ILLEGAL = 255
+WDL_ILLEGAL, WDL_LOSS, WDL_DRAW, WDL_WIN = 0, 1, 2, 3
+
+DTM_MAGIC = b'DLTBDTM1'
+WDL_MAGIC = b'DLTBWDL1'
+DEFAULT_TABLES = ('KQK', 'KRK', 'KPK')
+DEFAULT_DIRECTORY = 'tablebases'
+
+PIECE_ORDER = 'QRBNP' # Order of the pieces after the king in a signature
+DRAWN_MATERIAL = {'KK', 'KBK', 'KNK'} # Neither side can mate, no table needed
+SLIDER_RAYS = {'Q': QUEEN_RAYS, 'R': ROOK_RAYS, 'B': BISHOP_RAYS}
+KNIGHT_SETS = [frozenset(targets) for targets in KNIGHT_TARGETS]
+KING_SETS = [frozenset(targets) for targets in KING_TARGETS]
+PAWN_SETS = [[frozenset(targets) for targets in PAWN_CAPTURES[colour]] for colour in (0, 1)]
+PAWN_STEP = (-8, 8) # White pawns move up the board, towards row 0
+PAWN_START_ROW = (6, 1)
+
+
+def _line_tables():
+    """
+    For every (from, to) pair: which sliders share a line through both squares, and the squares between
+    """
+    kinds = [None] * (64 * 64)
+    between = [()] * (64 * 64)
+    for start in range(64):
+        for letter in 'RB':
+            for ray in SLIDER_RAYS[letter][start]:
+                for i, square in enumerate(ray):
+                    kinds[start * 64 + square] = letter
+                    between[start * 64 + square] = ray[:i]
+    return kinds, between
+
+LINE_KINDS, BETWEEN = _line_tables()
+
+
+def parse_signature(name):
+    """
+    Pieces of a signature as [(colour, kind)], colour 0 for white, e.g. KPK -> [(0,'K'), (0,'P'), (1,'K')]
+    """
+    if name.count('K') != 2 or not name.startswith('K'):
+        raise ValueError(f"'{name}' is not a material signature such as KQK")
+    split = name.index('K', 1)
+    return [(0, kind) for kind in name[:split]] + [(1, kind) for kind in name[split:]]
+
+
+def signature(pieces):
+    """
+    Signature of [(colour, kind, ...)] as it is written, white first
+    """
+    sides = ['K', 'K']
+    for piece in pieces:
+        if piece[1] != 'K':
+            sides[piece[0]] += piece[1]
+    return ''.join('K' + ''.join(sorted(side[1:], key=PIECE_ORDER.index)) for side in sides)
+
+
+def _needs_flip(pieces):
+    """
+    Whether black has the stronger side, tables are only stored with white the stronger side
+    """
+    strength = [[0, ''], [0, '']]
+    for colour, kind, *_ in pieces:
+        if kind != 'K':
+            strength[colour][0] += PIECE_VALUES[kind]
+            strength[colour][1] += str(PIECE_ORDER.index(kind))
+    return strength[1][0] > strength[0][0] or (strength[1][0] == strength[0][0] and strength[1][1] < strength[0][1])
+
+
+def canonical(pieces, white_to_move):
+    """
+    (signature, squares in signature order, side to move 0/1) of [(colour, kind, square)],
+    with colours swapped and the board mirrored when black holds the stronger side
+    """
+    if _needs_flip(pieces):
+        pieces = [(1 - colour, kind, square ^ 56) for colour, kind, square in pieces]
+        white_to_move = not white_to_move
+    name = signature(pieces)
+    order = parse_signature(name)
+    remaining = list(pieces)
+    squares = []
+    for colour, kind in order:
+        for i, piece in enumerate(remaining):
+            if piece[0] == colour and piece[1] == kind:
+                squares.append(piece[2])
+                del remaining[i]
+                break
+    return name, squares, 0 if white_to_move else 1
+
+
+def position_index(squares, side_to_move):
+    index = side_to_move
+    for square in squares:
+        index = index * 64 + square
+    return index
+
+
+def _attacks(kind, colour, start, target, occupied):
+    if kind == 'N':
+        return target in KNIGHT_SETS[start]
+    if kind == 'K':
+        return target in KING_SETS[start]
+    if kind == 'P':
+        return target in PAWN_SETS[colour][start]
+    line = LINE_KINDS[start * 64 + target]
+    if line is None or (kind != 'Q' and kind != line):
+        return False
+    return not any(square in occupied for square in BETWEEN[start * 64 + target])
+
+
+def in_check(pieces, colour):
+    """
+    Whether the king of colour is attacked in [(colour, kind, square)]
+    """
+    occupied = {piece[2] for piece in pieces}
+    king = next(square for piece_colour, kind, square in pieces if piece_colour == colour and kind == 'K')
+    return any(piece_colour != colour and _attacks(kind, piece_colour, square, king, occupied)
+               for piece_colour, kind, square in pieces)
+
+
+def is_legal(pieces, side_to_move):
+    """
+    Pawns off the back ranks, and the side that just moved not left in check (which also keeps the kings apart)
+    """
+    for _, kind, square in pieces:
+        if kind == 'P' and (square < 8 or square >= 56):
+            return False
+    return not in_check(pieces, 1 - side_to_move)
+
+
+def generate_moves(pieces, side_to_move):
+    """
+    Yields (pieces after the move, whether the move leaves the table) for every legal move.
+    Captures and promotions leave the table, promotions are made to each of Q, R, B and N.
+    """
+    occupied = {piece[2]: i for i, piece in enumerate(pieces)}
+    for i, (colour, kind, square) in enumerate(pieces):
+        if colour != side_to_move:
+            continue
+        if kind == 'P':
+            targets = []
+            step = square + PAWN_STEP[colour]
+            if step not in occupied:
+                targets.append(step)
+                double = step + PAWN_STEP[colour]
+                if square // 8 == PAWN_START_ROW[colour] and double not in occupied:
+                    targets.append(double)
+            targets.extend(target for target in PAWN_CAPTURES[colour][square] if target in occupied)
+        elif kind in SLIDER_RAYS:
+            targets = []
+            for ray in SLIDER_RAYS[kind][square]:
+                for target in ray:
+                    targets.append(target)
+                    if target in occupied:
+                        break
+        else:
+            targets = KNIGHT_TARGETS[square] if kind == 'N' else KING_TARGETS[square]
+
+        for target in targets:
+            captured = occupied.get(target)
+            if captured is not None and (pieces[captured][0] == colour or pieces[captured][1] == 'K'):
+                continue
+            promotes = kind == 'P' and (target < 8 or target >= 56)
+            for new_kind in ('QRBN' if promotes else kind):
+                after = list(pieces)
+                after[i] = (colour, new_kind, target)
+                if captured is not None:
+                    del after[captured]
+                if not in_check(after, colour):
+                    yield after, captured is not None or promotes
+
+
+def _unmove_targets(kind, colour, square, occupied):
+    """
+    Empty squares the piece could have come from by a non-capturing move
+    """
+    if kind == 'P':
+        back = square - PAWN_STEP[colour]
+        targets = []
+        if 8 <= back < 56 and back not in occupied:
+            targets.append(back)
+            double = back - PAWN_STEP[colour]
+            if double // 8 == PAWN_START_ROW[colour] and double not in occupied:
+                targets.append(double)
+        return targets
+    if kind in SLIDER_RAYS:
+        targets = []
+        for ray in SLIDER_RAYS[kind][square]:
+            for target in ray:
+                if target in occupied:
+                    break
+                targets.append(target)
+        return targets
+    targets = KNIGHT_TARGETS[square] if kind == 'N' else KING_TARGETS[square]
+    return [target for target in targets if target not in occupied]
+
+
+def _flip_result(value):
+    """
+    Value for the side that moved into a position worth value to the side to move
+    """
+    if value == DRAW:
+        return DRAW
+    if value >= LOSS:
+        return value - LOSS + 1 # The side to move there is mated, so the mover wins one ply later
+    return LOSS + value + 1
+
+
+def _better(a, b):
+    """
+    Whether value a is better than b for the side to move: quicker wins, then draws, then slower losses
+    """
+    def rank(value):
+        if value == DRAW:
+            return 0
+        return 1000 - value if value < LOSS else -1000 + (value - LOSS)
+    return rank(a) > rank(b)
+
+
+class TablebaseGenerator:
+    """
+    Solves tables in memory, tables that captures and promotions lead to are solved first
+    """
+    def __init__(self, log=print):
+        self.tables = {}
+        self.log = log
+
+    def value_of(self, pieces, side_to_move):
+        """
+        DTM value of any position covered by the solved tables, for the side to move
+        """
+        name, squares, flipped_side = canonical(pieces, side_to_move == 0)
+        if name in DRAWN_MATERIAL:
+            return DRAW
+        if name not in self.tables:
+            self.solve(name)
+        return self.tables[name][position_index(squares, flipped_side)]
+
+    def solve(self, name):
+        start = time.perf_counter()
+        order = parse_signature(name)
+        count = len(order)
+        size = 2 * 64 ** count
+        values = bytearray(size) # DRAW until solved
+        solved = bytearray(size)
+        moves_left = bytearray(size) # Moves that stay in the table not yet known to lose
+        exits = {} # Best value of the moves leaving the table, for positions with any
+        buckets = {} # Plies -> [(index, value)] waiting to be solved at that distance
+
+        def schedule(index, value):
+            plies = value - LOSS if value >= LOSS else value
+            buckets.setdefault(plies, []).append((index, value))
+
+        for squares in product(range(64), repeat=count):
+            if len(set(squares)) < count:
+                for side in (0, 1):
+                    values[position_index(squares, side)] = ILLEGAL
+                continue
+            for side in (0, 1):
+                index = position_index(squares, side)
+                pieces = [(colour, kind, square) for (colour, kind), square in zip(order, squares)]
+                if not is_legal(pieces, side):
+                    values[index] = ILLEGAL
+                    continue
+                inside = 0
+                best_exit = None
+                for after, leaves in generate_moves(pieces, side):
+                    if not leaves:
+                        inside += 1
+                        continue
+                    value = _flip_result(self.value_of(after, 1 - side))
+                    if best_exit is None or _better(value, best_exit):
+                        best_exit = value
+                if inside == 0 and best_exit is None: # Checkmate or stalemate
+                    if in_check(pieces, side):
+                        schedule(index, LOSS)
+                    else:
+                        solved[index] = 1
+                    continue
+                moves_left[index] = inside
+                if best_exit is not None:
+                    exits[index] = best_exit
+                    if best_exit != DRAW and best_exit < LOSS:
+                        schedule(index, best_exit)
+                    elif inside == 0:
+                        if best_exit == DRAW:
+                            solved[index] = 1
+                        else:
+                            schedule(index, best_exit)
+
+        plies = 0
+        while buckets:
+            for index, value in buckets.pop(plies, ()):
+                if solved[index]:
+                    continue
+                solved[index] = 1
+                values[index] = value
+                side, squares = self._decode(index, count)
+                pieces = [(colour, kind, square) for (colour, kind), square in zip(order, squares)]
+                occupied = set(squares)
+                mover = 1 - side
+                for i, (colour, kind, square) in enumerate(pieces):
+                    if colour != mover:
+                        continue
+                    for origin in _unmove_targets(kind, colour, square, occupied):
+                        before = list(squares)
+                        before[i] = origin
+                        previous = position_index(before, mover)
+                        if solved[previous] or values[previous] == ILLEGAL:
+                            continue
+                        if value >= LOSS: # Moving here mates in one more ply
+                            schedule(previous, plies + 1)
+                            continue
+                        moves_left[previous] -= 1
+                        if moves_left[previous] == 0:
+                            best_exit = exits.get(previous)
+                            if best_exit is None or best_exit >= LOSS:
+                                schedule(previous, max(LOSS + plies + 1, best_exit or 0))
+                            elif best_exit == DRAW:
+                                solved[previous] = 1
+            plies += 1
+
+        self.tables[name] = values
+        self.log(f'{name}  {size} positions  {time.perf_counter() - start:.1f}s')
+        return values
+
+    @staticmethod
+    def _decode(index, count):
+        squares = []
+        for _ in range(count):
+            index, square = divmod(index, 64)
+            squares.append(square)
+        return index, squares[::-1]
+
+
+def write_table(directory, name, values):
+    """
+    Writes <name>.dtm and <name>.wdl for the DTM values of a solved table
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name + '.dtm'), 'wb') as file:
+        file.write(DTM_MAGIC)
+        file.write(values)
+    packed = bytearray((len(values) + 3) // 4)
+    for index, value in enumerate(values):
+        wdl = WDL_ILLEGAL if value == ILLEGAL else WDL_DRAW if value == DRAW else WDL_LOSS if value >= LOSS else WDL_WIN
+        packed[index >> 2] |= wdl << ((index & 3) * 2)
+    with open(os.path.join(directory, name + '.wdl'), 'wb') as file:
+        file.write(WDL_MAGIC)
+        file.write(packed)
+
+
+def generate(names=DEFAULT_TABLES, directory=DEFAULT_DIRECTORY, log=print):
+    """
+    Solves and writes the named tables, along with the tables they depend on
+    """
+    generator = TablebaseGenerator(log)
+    for name in names:
+        name = canonical([(colour, kind, 0) for colour, kind in parse_signature(name)], True)[0] # e.g. KKQ -> KQK
+        if name not in generator.tables and name not in DRAWN_MATERIAL:
+            generator.solve(name)
+    for name, values in generator.tables.items():
+        write_table(directory, name, values)
+    return sorted(generator.tables)
+
+
+class Tablebase:
+    """
+    Probes the tables found in a directory, each file memory-mapped the first time it is needed.
+    probe(projection) gives the DTM value of the position for the side to move, probe_wdl only
+    reads the smaller win/draw/loss file. Both return None for material without a table.
+    Pickling keeps only the directory.
+    """
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = directory
+        self.available = {entry[:-4] for entry in os.listdir(directory) if entry.endswith('.dtm')} \
+            if os.path.isdir(directory) else set()
+        self.max_pieces = max((len(name) for name in self.available), default=0)
+        self.maps = {}
+
+    def __getstate__(self):
+        return {'directory': self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'])
+
+    def close(self):
+        for file, table in self.maps.values():
+            table.close()
+            file.close()
+        self.maps = {}
+
+    def _table(self, name, extension, magic):
+        key = name + extension
+        if key not in self.maps:
+            file = open(os.path.join(self.directory, key), 'rb')
+            table = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            if table[:len(magic)] != magic:
+                raise ValueError(f'{key} is not a tablebase file')
+            self.maps[key] = (file, table)
+        return self.maps[key][1]
+
+    def _lookup(self, projection):
+        """
+        (signature, index) of the projected position, signature None when the material is drawn
+        and no table is needed, or None when there is no table for it
+        """
+        if projection.piece_count > self.max_pieces:
+            return None
+        pieces = []
+        for square, code in enumerate(projection.squares):
+            if code:
+                pieces.append((code >> 3, PIECE_NAMES[code][1], square))
+        name, squares, side = canonical(pieces, projection.white_to_move)
+        if name in DRAWN_MATERIAL:
+            return None, 0
+        if name not in self.available:
+            return None
+        return name, position_index(squares, side)
+
+    def probe(self, projection):
+        """
+        DTM value of the projected position for the side to move, see the module docstring
+        """
+        found = self._lookup(projection)
+        if found is None:
+            return None
+        name, index = found
+        if name is None:
+            return DRAW
+        return self._table(name, '.dtm', DTM_MAGIC)[len(DTM_MAGIC) + index]
+
+    def probe_wdl(self, projection):
+        """
+        1 when the side to move wins, 0 for a draw, -1 when it loses
+        """
+        found = self._lookup(projection)
+        if found is None:
+            return None
+        name, index = found
+        if name is None:
+            return 0
+        wdl = (self._table(name, '.wdl', WDL_MAGIC)[len(WDL_MAGIC) + (index >> 2)] >> ((index & 3) * 2)) & 3
+        return wdl - WDL_DRAW
+
+    def best_move(self, projection):
+        """
+        The move keeping the best result with the shortest win or the longest loss,
+        None when some move leads out of the tables
+        """
+        best_move = None
+        best_value = None
+        for code in projection.generate_legal_moves():
+            projection.make_projection(code)
+            value = self.probe(projection)
+            projection.undo_projection()
+            if value is None or value == ILLEGAL:
+                return None
+            value = _flip_result(value)
+            if best_value is None or _better(value, best_value):
+                best_move, best_value = code, value
+        return Move.from_code(best_move, projection.board) if best_move is not None else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate endgame tablebases by retrograde analysis')
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate_parser = commands.add_parser('generate', help='solve tables and write them to a directory')
+    generate_parser.add_argument('tables', nargs='*', default=list(DEFAULT_TABLES), help='signatures such as KQK')
+    generate_parser.add_argument('--directory', default=DEFAULT_DIRECTORY)
+    probe_parser = commands.add_parser('probe', help='look up a position')
+    probe_parser.add_argument('fen')
+    probe_parser.add_argument('--directory', default=DEFAULT_DIRECTORY)
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        names = generate(args.tables, args.directory)
+        print(f"wrote {', '.join(names)} to {args.directory}")
+    else:
+        from app.game_state import GameState
+        projection = GameState.from_fen(args.fen).get_projection_at_current_state()
+        tablebase = Tablebase(args.directory)
+        value = tablebase.probe(projection)
+        if value is None:
+            print('no table for this material')
+        elif value == DRAW:
+            print('draw')
+        else:
+            result = f'loss in {value - LOSS}' if value >= LOSS else f'win in {value}'
+            move = tablebase.best_move(projection)
+            print(f"{result} plies, best move {move.get_chess_notation() if move is not None else '-'}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,108 @@
+from array import array
+
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+NO_MOVE = 0
+
+# Bytes per entry across the parallel arrays: key, move, score, depth, bound and age
+ENTRY_BYTES = 8 + 2 + 4 + 1 + 1 + 1
+
+
+class TranspositionTable:
+    """
+    Fixed-size table of search results keyed by the Zobrist key of a position.
+
+    Entries live in parallel typed arrays, so the table never grows past its
+    memory budget. Each key maps to exactly one slot. Entries from earlier
+    searches can always be replaced, and when two positions from the current
+    search collide, replacement decides which one is kept:
+        'depth': keep whichever result was searched deeper
+        'age':   always keep the newest result
+    Moves are stored as ints, with NO_MOVE (0) meaning no move.
+    """
+    def __init__(self, size_mb=16, replacement='depth'):
+        if replacement not in ('depth', 'age'):
+            raise ValueError("Use either 'depth' or 'age' replacement")
+        entries = max(1, int(size_mb * 1024 * 1024) // ENTRY_BYTES)
+        self.size = 1 << (entries.bit_length() - 1) # Round down to a power of two for masking
+        self.mask = self.size - 1
+        self.replacement = replacement
+        self.keys = array('Q', bytes(8 * self.size))
+        self.moves = array('H', bytes(2 * self.size))
+        self.scores = array('i', bytes(4 * self.size))
+        self.depths = array('b', bytes(self.size))
+        self.bounds = array('B', bytes(self.size))
+        self.ages = array('B', bytes(self.size))
+        self.age = 1 # Slots with age 0 have never been written
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0
+        self.rejections = 0
+
+    def new_search(self):
+        """
+        Marks the start of a new search so older entries become preferred for replacement
+        """
+        self.age = self.age % 255 + 1
+
+    def clear(self):
+        self.ages = array('B', bytes(self.size))
+        self.hits = self.misses = self.stores = self.overwrites = self.rejections = 0
+
+    def probe(self, key):
+        """
+        Returns (depth, score, bound, move) stored for key, or None
+        """
+        index = key & self.mask
+        if self.ages[index] and self.keys[index] == key:
+            self.hits += 1
+            return self.depths[index], self.scores[index], self.bounds[index], self.moves[index]
+        self.misses += 1
+        return None
+
+    def best_move(self, key):
+        """
+        Stored move for key without counting a probe, NO_MOVE if there is none
+        """
+        index = key & self.mask
+        if self.ages[index] and self.keys[index] == key:
+            return self.moves[index]
+        return NO_MOVE
+
+    def store(self, key, depth, score, bound, move=NO_MOVE):
+        index = key & self.mask
+        stored_age = self.ages[index]
+        if stored_age and self.keys[index] != key:
+            if self.replacement == 'depth' and stored_age == self.age and depth < self.depths[index]:
+                self.rejections += 1
+                return
+            self.overwrites += 1
+        elif stored_age and move == NO_MOVE:
+            move = self.moves[index] # Keep the known best move of the same position
+
+        self.keys[index] = key
+        self.depths[index] = max(-128, min(127, depth))
+        self.scores[index] = score
+        self.bounds[index] = bound
+        self.moves[index] = move
+        self.ages[index] = self.age
+        self.stores += 1
+
+    def memory_bytes(self):
+        return self.size * ENTRY_BYTES
+
+    def stats(self):
+        """
+        Counters for monitoring, probes split into hits and misses
+        """
+        probes = self.hits + self.misses
+        return {
+            'size': self.size,
+            'memory_bytes': self.memory_bytes(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / probes if probes else 0.0,
+            'stores': self.stores,
+            'overwrites': self.overwrites,
+            'rejections': self.rejections,
+        }
@@ -0,0 +1,227 @@
+"""
+UCI (Universal Chess Interface) front-end over stdin/stdout.
+
+Lets tournament managers and test harnesses drive SearchAI without the
+pygame interface. Searches run on a background thread, so stop, isready and
+quit are answered while a search is in progress.
+
+    python uci.py
+"""
+import sys
+import threading
+
+from app.fen import START_FEN
+from app.game_state import GameState
+from app.chess_ai import SearchAI, MATE_SCORE, MATE_THRESHOLD
+from app.transposition_table import TranspositionTable
+from app.opening_book import OpeningBook
+from app.tablebase import Tablebase
+
+ENGINE_NAME = 'DL Chess'
+ENGINE_AUTHOR = 'DL'
+
+MAX_DEPTH = 64 # Depth used when go gives no depth, the search is then bounded by time, nodes or stop
+DEFAULT_HASH_MB = 16
+DEFAULT_MOVES_TO_GO = 30 # Moves the remaining clock time is shared between when go does not say
+GO_INT_PARAMS = ('depth', 'movetime', 'wtime', 'btime', 'winc', 'binc', 'movestogo', 'nodes')
+
+
+class UCIEngine:
+    """
+    Reads UCI commands one line at a time with handle() and writes the replies to output
+    """
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.hash_mb = DEFAULT_HASH_MB
+        self.transposition_table = TranspositionTable(self.hash_mb)
+        self.opening_book = None
+        self.tablebase = None
+        self.game_state = GameState.from_fen(START_FEN)
+        self.ai = None
+        self.search_thread = None
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def handle(self, line):
+        """
+        Runs one command, returns False once the engine should quit
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+
+        if command == 'uci':
+            self.send(f'id name {ENGINE_NAME}')
+            self.send(f'id author {ENGINE_AUTHOR}')
+            self.send(f'option name Hash type spin default {DEFAULT_HASH_MB} min 1 max 1024')
+            self.send('option name BookFile type string default <empty>')
+            self.send('option name TablebasePath type string default <empty>')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'setoption':
+            self.set_option(args)
+        elif command == 'ucinewgame':
+            self.stop_search()
+            self.transposition_table.clear()
+            self.game_state = GameState.from_fen(START_FEN)
+        elif command == 'position':
+            self.stop_search()
+            self.set_position(args)
+        elif command == 'go':
+            self.stop_search()
+            self.start_search(args)
+        elif command == 'stop':
+            self.stop_search()
+        elif command == 'quit':
+            self.stop_search()
+            return False
+        return True
+
+    def set_option(self, args):
+        """
+        setoption name <name> value <value>
+        A value that cannot be used is reported with info string and the old setting is kept.
+        """
+        if 'name' not in args or 'value' not in args:
+            return
+        name = ' '.join(args[args.index('name') + 1:args.index('value')])
+        value = ' '.join(args[args.index('value') + 1:])
+        if name.lower() == 'hash':
+            try:
+                hash_mb = max(1, int(value))
+            except ValueError:
+                self.send(f"info string Hash value '{value}' is not a number")
+                return
+            self.stop_search()
+            self.hash_mb = hash_mb
+            self.transposition_table = TranspositionTable(self.hash_mb)
+        elif name.lower() == 'bookfile':
+            self.stop_search()
+            try:
+                opening_book = OpeningBook(value) if value and value != '<empty>' else None
+            except (OSError, ValueError) as error:
+                self.send(f'info string cannot open book {value}: {error}')
+                return
+            if self.opening_book is not None:
+                self.opening_book.close()
+            self.opening_book = opening_book
+        elif name.lower() == 'tablebasepath':
+            self.stop_search()
+            try:
+                tablebase = Tablebase(value) if value and value != '<empty>' else None
+            except OSError as error:
+                self.send(f'info string cannot open tablebases in {value}: {error}')
+                return
+            if self.tablebase is not None:
+                self.tablebase.close()
+            self.tablebase = tablebase
+
+    def set_position(self, args):
+        """
+        position [startpos | fen <fen>] [moves <move> ...]
+        An illegal move is reported with info string and it and the moves after it are left out.
+        """
+        moves_index = args.index('moves') if 'moves' in args else len(args)
+        if args and args[0] == 'fen':
+            fen = ' '.join(args[1:moves_index])
+        else:
+            fen = START_FEN
+        try:
+            game_state = GameState.from_fen(fen)
+        except ValueError as error:
+            self.send(f'info string {error}')
+            return
+        self.game_state = game_state
+        for text in args[moves_index + 1:]:
+            try:
+                move = self.parse_move(text)
+            except ValueError as error: # Keep the moves before the bad one, as other engines do
+                self.send(f'info string {error}')
+                break
+            self.game_state.make_move(move)
+
+    def parse_move(self, text):
+        """
+        Legal Move for a move in long algebraic notation, e.g. e2e4 or e7e8q
+        """
+        return self.game_state.parse_move(text)
+
+    def search_limits(self, args):
+        """
+        (max_depth, time_limit in seconds, node_limit) for the arguments of go.
+        A parameter whose value is not a number is reported with info string and ignored.
+        """
+        params = {}
+        for i, token in enumerate(args[:-1]):
+            if token in GO_INT_PARAMS:
+                try:
+                    params[token] = int(args[i + 1])
+                except ValueError:
+                    self.send(f"info string {token} value '{args[i + 1]}' is not a number")
+
+        max_depth = params.get('depth', MAX_DEPTH)
+        node_limit = params.get('nodes')
+        time_limit = None
+        if 'movetime' in params:
+            time_limit = params['movetime'] / 1000
+        else:
+            side = 'w' if self.game_state.white_to_move else 'b'
+            time_left = params.get(side + 'time')
+            if time_left is not None:
+                increment = params.get(side + 'inc', 0)
+                moves_to_go = params.get('movestogo', DEFAULT_MOVES_TO_GO)
+                time_limit = min(time_left / moves_to_go + increment, time_left / 2) / 1000
+        return max_depth, time_limit, node_limit
+
+    def start_search(self, args):
+        max_depth, time_limit, node_limit = self.search_limits(args)
+        self.ai = SearchAI(self.game_state, max_depth=max_depth, time_limit=time_limit, node_limit=node_limit,
+                           transposition_table=self.transposition_table, info_callback=self.send_info,
+                           opening_book=self.opening_book, tablebase=self.tablebase)
+        self.search_thread = threading.Thread(target=self._search, args=(self.ai,), daemon=True)
+        self.search_thread.start()
+
+    def _search(self, ai):
+        move = ai.find_move()
+        self.send('bestmove ' + (move.get_chess_notation() if move is not None else '0000'))
+
+    def stop_search(self):
+        """
+        Stops a running search and waits for it to report its best move
+        """
+        if self.search_thread is not None and self.search_thread.is_alive():
+            self.ai.stop()
+            self.search_thread.join()
+        self.search_thread = None
+
+    def send_info(self, info):
+        self.send(f"info depth {info['depth']} score {self.format_score(info['score'])} nodes {info['nodes']} "
+                  f"nps {info['nps']} time {int(info['time'] * 1000)} pv {' '.join(move.get_chess_notation() for move in info['pv'])}")
+
+    @staticmethod
+    def format_score(score):
+        """
+        Centipawns as 'cp <score>', mates as 'mate <moves>', negative when the engine is mated
+        """
+        if abs(score) >= MATE_THRESHOLD:
+            moves = (MATE_SCORE - abs(score) + 1) // 2
+            return f'mate {moves if score > 0 else -moves}'
+        return f'cp {score}'
+
+
+def main():
+    engine = UCIEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            return
+    engine.stop_search() # Input closed without quit, a search without limits would otherwise never end
+
+
+if __name__ == '__main__':
+    main()
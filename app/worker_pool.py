@@ -0,0 +1,63 @@
+"""
+Bounded task queueing on a process pool, shared by batch analysis and matches.
+
+Tasks are queued from an iterable only while fewer than PENDING_PER_WORKER
+per worker are waiting, so inputs of any length are streamed rather than all
+queued up front, and a run can stop early without a backlog to drain.
+"""
+import os, threading
+from multiprocessing import Pool
+
+from app.transposition_table import TranspositionTable
+
+PENDING_PER_WORKER = 4 # Tasks queued per worker, bounds memory while keeping every worker busy
+
+worker_tables = None # Transposition tables of this worker process, set by init_tables
+
+
+def init_tables(hash_mb, count):
+    """
+    Pool initializer giving the worker process count transposition tables of hash_mb MB
+    """
+    global worker_tables
+    worker_tables = tuple(TranspositionTable(hash_mb) for _ in range(count))
+
+
+def run_tasks(function, tasks, workers=None, initializer=None, initargs=(), on_result=None, should_stop=None,
+              pending_per_worker=PENDING_PER_WORKER):
+    """
+    Calls function(*args) on a pool of worker processes for every args tuple of tasks.
+    on_result is called in this process with each result as it comes in. should_stop, if given,
+    is asked before each task is queued and no more are queued once it returns True.
+    The first exception raised by a task is raised again once the queued tasks have finished.
+    Returns the number of tasks queued.
+    """
+    workers = workers or os.cpu_count() or 1
+    pending = threading.BoundedSemaphore(workers * pending_per_worker)
+    failures = []
+    count = 0
+
+    with Pool(workers, initializer, initargs) as pool:
+        def task_done(result):
+            try:
+                if on_result is not None:
+                    on_result(result)
+            finally:
+                pending.release()
+
+        def task_failed(error):
+            failures.append(error)
+            pending.release()
+
+        for args in tasks:
+            pending.acquire() # Waits while enough tasks are already queued
+            if failures or (should_stop is not None and should_stop()):
+                break
+            pool.apply_async(function, args, callback=task_done, error_callback=task_failed)
+            count += 1
+        pool.close()
+        pool.join()
+
+    if failures:
+        raise failures[0]
+    return count
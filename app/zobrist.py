@@ -0,0 +1,62 @@
+"""
+Zobrist keys for hashing positions into 64-bit ints.
+
+A position key is the XOR of one random number per (piece, square), one for
+black to move, one for the castling rights and one for the en passant file.
+Making a move only XORs the keys of what changed, so the key can be kept up
+to date in O(1) per move.
+"""
+import random
+
+from app.mailbox import PIECE_CODES
+
+PIECES = ['wP', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bP', 'bN', 'bB', 'bR', 'bQ', 'bK']
+
+_rng = random.Random(0x5EED) # Fixed seed so keys are the same in every process
+PIECE_KEYS = {piece: [_rng.getrandbits(64) for _ in range(64)] for piece in PIECES}
+BLACK_TO_MOVE_KEY = _rng.getrandbits(64)
+CASTLING_KEYS = [_rng.getrandbits(64) for _ in range(16)]
+EN_PASSANT_KEYS = [_rng.getrandbits(64) for _ in range(8)]
+
+# The piece keys by mailbox piece code, the empty square's keys are all 0 so XORing them changes nothing
+PIECE_KEYS_BY_CODE = [[0] * 64 for _ in range(16)]
+for _piece, _keys in PIECE_KEYS.items():
+    PIECE_KEYS_BY_CODE[PIECE_CODES[_piece]] = _keys
+
+
+def castling_key(castling_rights):
+    return CASTLING_KEYS[castling_rights.wks | (castling_rights.wqs << 1) | (castling_rights.bks << 2) | (castling_rights.bqs << 3)]
+
+
+def en_passant_key(board, en_passant_possible, white_to_move):
+    """
+    Key for the en passant square, only counted when a pawn can actually capture there
+    """
+    if not en_passant_possible:
+        return 0
+    r, c = en_passant_possible
+    if white_to_move:
+        capture_row, capturer = r + 1, 'wP'
+    else:
+        capture_row, capturer = r - 1, 'bP'
+    if (c > 0 and board[capture_row][c-1] == capturer) or (c < 7 and board[capture_row][c+1] == capturer):
+        return EN_PASSANT_KEYS[c]
+    return 0
+
+
+def hash_position(board, white_to_move, castling_rights, en_passant_possible):
+    """
+    Full key of a position, computed from scratch
+    """
+    key = 0
+    for r in range(8):
+        row = board[r]
+        for c in range(8):
+            piece = row[c]
+            if piece != '--':
+                key ^= PIECE_KEYS[piece][r * 8 + c]
+    if not white_to_move:
+        key ^= BLACK_TO_MOVE_KEY
+    key ^= castling_key(castling_rights)
+    key ^= en_passant_key(board, en_passant_possible, white_to_move)
+    return key
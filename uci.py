@@ -0,0 +1,5 @@
+from app.uci import main
+
+
+if __name__ == "__main__":
+    main()